@@ -0,0 +1,60 @@
+"""Micro-benchmark of summary prompt construction for large channels.
+
+Compares the precompiled prompt builder with building LangChain prompt templates per call, which is what
+summarize_messages did before. Run from the repository root:
+
+    python benchmarks/bench_prompt_builder.py [--messages 10000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../lambda_src")))
+from summarizer import (  # noqa: E402
+    SYSTEM_PROMPT, INSTRUCTIONS_PROMPT, build_prompt_messages, format_conversation
+)
+
+PERIOD_TEXT = "2025-01-01 22:00:00 - 2025-01-02 22:00:00"
+
+
+def make_messages(count: int) -> list:
+    """Builds fake Telegram messages with a handful of distinct senders."""
+    senders = [SimpleNamespace(first_name=f"User{i}", last_name="Test") for i in range(20)]
+    return [
+        SimpleNamespace(sender=senders[i % len(senders)], text=f"Message number {i} about topic {i % 7}")
+        for i in range(count)
+    ]
+
+
+def build_with_templates(messages: list) -> list:
+    """The per-call template approach, kept here as the baseline."""
+    human_template = f"{INSTRUCTIONS_PROMPT}\nПериод: {PERIOD_TEXT}\nРазговор:\n{format_conversation(messages)}"
+    chat_prompt = ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(SYSTEM_PROMPT),
+        HumanMessagePromptTemplate.from_template(human_template),
+    ])
+    return chat_prompt.format_prompt().to_messages()
+
+
+def build_with_builder(messages: list) -> list:
+    return build_prompt_messages(format_conversation(messages), PERIOD_TEXT)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    print(f"Prompt construction for {args.messages} messages, best of {args.repeat}:")
+    for name, build in (("per-call templates", build_with_templates), ("prompt builder", build_with_builder)):
+        best = min(timeit.repeat(lambda: build(messages), number=1, repeat=args.repeat))
+        print(f"  {name:<20} {best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from checkpoint import checkpoint_key, LocalFileCheckpointStore, STAGE_FETCHED, STAGE_SUMMARIZED
+from summarizer import summarize_messages, summarize_messages_structured, topic_titles, SUMMARY_ERROR_PREFIX
+from summary_index import DEFAULT_SUMMARY_INDEX_PATH
+from telegram_processor import (
+    fetch_messages, publish_summary, is_window_complete, store_summary, checkpointed_topics
+)
+from telethon import TelegramClient
+from utils import get_secrets, load_config, initialize_telegram_client, floor_to_run_hour, DEFAULT_RUN_HOUR_UTC
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = "backfill_checkpoint.json"
+DEFAULT_CONCURRENCY = 4
+
+
+def parse_date(value: str) -> datetime:
+    """Parses an ISO date or datetime from the command line. Naive values are treated as UTC."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def build_windows(start_date: datetime, end_date: datetime, period_hours: int,
+                  full_windows_only: bool = False) -> List[Tuple[datetime, datetime]]:
+    """Splits [start_date, end_date) into consecutive windows of `period_hours`. The last window may be shorter,
+    unless `full_windows_only` is set, in which case it is left out."""
+    period = timedelta(hours=period_hours)
+    windows = []
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + period, end_date)
+        if full_windows_only and window_end - window_start < period:
+            break
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+def slice_messages(messages: List, windows: List[Tuple[datetime, datetime]],
+                   num_of_messages_limit: int) -> List[List]:
+    """Distributes chronologically ordered messages over sorted windows, keeping at most the
+    `num_of_messages_limit` most recent messages per window (same as a regular run would)."""
+    sliced: List[List] = [[] for _ in windows]
+    idx = 0
+    for i, (window_start, window_end) in enumerate(windows):
+        while idx < len(messages) and messages[idx].date < window_end:
+            if messages[idx].date >= window_start:
+                sliced[i].append(messages[idx])
+            idx += 1
+        sliced[i] = sliced[i][-num_of_messages_limit:]
+    return sliced
+
+
+async def backfill_channel(client: TelegramClient, channel_config: Dict, secrets: Dict[str, str],
+                           start_date: datetime, end_date: datetime, num_of_messages_limit: int,
+                           llm_model_name: str, llm_temperature: float, reader_timezone: str,
+                           llm_image_model_name: str, semaphore: asyncio.Semaphore, checkpoint,
+                           summary_index_path: Optional[str] = None, full_windows_only: bool = False) -> None:
+    """Fetches the channel history for all unfinished windows once, then summarizes the windows concurrently
+    and posts the summaries in chronological order, checkpointing every finished stage."""
+    channel_name = channel_config.get("SOURCE_CHANNEL_NAME", "Unknown")
+    source_channel_id = channel_config["SOURCE_CHANNEL_ID"]
+    summary_channel_id = channel_config["SUMMARY_CHANNEL_ID"]
+    generate_image_flag = channel_config.get("GENERATE_IMAGE", 0)
+    summary_period_hours = channel_config.get("SUMMARY_PERIOD_HOURS", 24)
+    structured = channel_config.get("SUMMARY_FORMAT", "text") == "structured"
+
+    windows = []
+    for window_start, window_end in build_windows(start_date, end_date, summary_period_hours,
+                                                     full_windows_only):
+        key = checkpoint_key(source_channel_id, window_start, window_end)
+        stages = checkpoint.get(key)
+        if not is_window_complete(stages, generate_image_flag):
+            windows.append((window_start, window_end, key, stages))
+    if not windows:
+        logger.info(f"All windows already completed for channel: {channel_name}")
+        return
+
+    logger.info(f"Backfilling {len(windows)} window(s) for channel: {channel_name}")
+    to_summarize = [w for w in windows if STAGE_SUMMARIZED not in w[3]]
+    window_messages: Dict[str, List] = {}
+    if to_summarize:
+        channel = await client.get_entity(source_channel_id)
+        messages = await fetch_messages(client, channel, to_summarize[0][0], to_summarize[-1][1], None)
+        sliced = slice_messages(messages, [(w[0], w[1]) for w in to_summarize], num_of_messages_limit)
+        for (_, _, key, _), msgs in zip(to_summarize, sliced):
+            window_messages[key] = msgs
+            checkpoint.mark(key, STAGE_FETCHED, len(msgs))
+
+    async def summarize_window(window_start: datetime, window_end: datetime,
+                               msgs: List) -> Tuple[str, Optional[Dict]]:
+        async with semaphore:
+            # Summarization is blocking, run it off the event loop so windows overlap
+            args = (msgs, window_start, window_end, llm_model_name, llm_temperature, reader_timezone,
+                    secrets["OPENAI_API_KEY"])
+            if structured:
+                return await asyncio.to_thread(summarize_messages_structured, *args)
+            return await asyncio.to_thread(summarize_messages, *args), None
+
+    tasks = {
+        key: asyncio.create_task(summarize_window(window_start, window_end, window_messages[key]))
+        for window_start, window_end, key, _ in to_summarize if window_messages[key]
+    }
+
+    try:
+        # Await in window order, so summaries are posted chronologically while later windows keep summarizing
+        for window_start, window_end, key, stages in windows:
+            if key in tasks:
+                summary_text, summary_data = await tasks[key]
+                if summary_text.startswith(SUMMARY_ERROR_PREFIX):
+                    # Leave the window unfinished in the checkpoint, so it is retried on the next run
+                    logger.error(f"Skipping window {window_start} - {window_end} for channel {channel_name}: "
+                                 f"{summary_text}")
+                    continue
+                store_summary(checkpoint, key, summary_text, summary_data, channel_config, window_start, window_end,
+                              summary_index_path)
+                topics = topic_titles(summary_data) if summary_data else None
+            elif STAGE_SUMMARIZED in stages:
+                summary_text = stages[STAGE_SUMMARIZED]
+                topics = checkpointed_topics(stages)
+            else:
+                logger.info(f"No messages in window {window_start} - {window_end} for channel: {channel_name}")
+                continue
+
+            await publish_summary(client, summary_channel_id, summary_text, generate_image_flag,
+                                  llm_image_model_name, secrets["OPENAI_API_KEY"], checkpoint, key, stages, topics)
+            logger.info(f"Summary for window {window_start} - {window_end} sent to channel: {channel_name}")
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+
+
+async def run_backfill(start_date: datetime, end_date: Optional[datetime] = None,
+                       channel_ids: Optional[List[int]] = None, concurrency: Optional[int] = None,
+                       checkpoint_path: str = DEFAULT_CHECKPOINT_PATH, config_path: str = "config.json") -> int:
+    """Backfills summaries for the selected channels (all enabled channels by default). Returns an exit code.
+    Both ends of the range are moved back to the daily schedule slot (RUN_HOUR_UTC), so the windows line up with
+    the scheduled run's. Without an end date the range ends now, and the trailing partial window of each channel
+    is skipped, so re-running the same command resumes with the same windows."""
+    client = None
+    system_channel_id = None
+
+    try:
+        secrets = get_secrets()
+        config = load_config(config_path)
+
+        system_channel_id = config.get("SYSTEM_CHANNEL_ID")
+        if not isinstance(system_channel_id, int):
+            raise ValueError("SYSTEM_CHANNEL_ID is missing or invalid in config.json")
+        run_hour_utc = int(config.get("RUN_HOUR_UTC", DEFAULT_RUN_HOUR_UTC))
+        full_windows_only = end_date is None
+        start_date = floor_to_run_hour(start_date, run_hour_utc)
+        end_date = floor_to_run_hour(end_date or datetime.now(timezone.utc), run_hour_utc)
+        if start_date >= end_date:
+            raise ValueError(f"Backfill start {start_date} must be before end {end_date}")
+
+        num_of_messages_limit = config.get("NUM_OF_MESSAGES_LIMIT", 300)
+        llm_model_name = config.get("LLM_MODEL_NAME", "gpt-4o-mini")
+        llm_temperature = float(config.get("LLM_TEMPERATURE", 0.0))
+        llm_image_model_name = config.get("LLM_IMAGE_MODEL_NAME", "dall-e-3")
+        reader_timezone = config.get("READER_TIMEZONE", "US/Central")
+        summary_index_path = config.get("SUMMARY_INDEX_PATH", DEFAULT_SUMMARY_INDEX_PATH)
+        if concurrency is None:
+            concurrency = int(config.get("BACKFILL_CONCURRENCY", DEFAULT_CONCURRENCY))
+        if concurrency < 1:
+            raise ValueError(f"Backfill concurrency must be at least 1, got {concurrency}")
+
+        if channel_ids:
+            channels = [c for c in config["channels"] if c["SOURCE_CHANNEL_ID"] in channel_ids]
+            unknown_ids = set(channel_ids) - {c["SOURCE_CHANNEL_ID"] for c in channels}
+            if unknown_ids:
+                raise ValueError(f"Unknown SOURCE_CHANNEL_ID(s): {', '.join(map(str, sorted(unknown_ids)))}")
+        else:
+            channels = [c for c in config["channels"] if c.get("ENABLED", 1) != 0]
+
+        checkpoint = LocalFileCheckpointStore(checkpoint_path)
+        semaphore = asyncio.Semaphore(concurrency)
+        client = await initialize_telegram_client(secrets)
+
+        results = await asyncio.gather(*[
+            backfill_channel(
+                client, channel_config, secrets, start_date, end_date, num_of_messages_limit,
+                llm_model_name, llm_temperature, reader_timezone, llm_image_model_name,
+                semaphore, checkpoint, summary_index_path, full_windows_only
+            )
+            for channel_config in channels
+        ], return_exceptions=True)
+
+        failures = [
+            f"{channel_config.get('SOURCE_CHANNEL_NAME', 'Unknown')}: {result}"
+            for channel_config, result in zip(channels, results) if isinstance(result, Exception)
+        ]
+        if failures:
+            raise RuntimeError(f"Backfill failed for channel(s): {'; '.join(failures)}")
+
+        logger.info("Backfill completed for all channels.")
+        return 0
+
+    except Exception as e:
+        critical_error_msg = f"Critical error in backfill: {e}"
+        logger.critical(critical_error_msg)
+
+        if client and isinstance(system_channel_id, int):
+            try:
+                await client.send_message(system_channel_id, critical_error_msg)
+            except Exception as telegram_error:
+                logger.critical(f"Failed to send error to SYSTEM_CHANNEL_ID: {telegram_error}")
+        return 1
+
+    finally:
+        if client:
+            await client.disconnect()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backfill Telegram chat summaries for a past date range.")
+    parser.add_argument("--start", required=True, type=parse_date,
+                        help="Start of the range (ISO date/datetime, UTC if no offset is given), moved back to "
+                             "the last RUN_HOUR_UTC:00")
+    parser.add_argument("--end", type=parse_date, default=None,
+                        help="End of the range, exclusive (defaults to now, summarizing complete windows only)")
+    parser.add_argument("--channels", type=int, nargs="+", default=None,
+                        help="SOURCE_CHANNEL_ID(s) to backfill (defaults to all enabled channels)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help=f"Max windows summarized at once (defaults to BACKFILL_CONCURRENCY or "
+                             f"{DEFAULT_CONCURRENCY})")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH,
+                        help="Checkpoint file used to resume an interrupted backfill")
+    parser.add_argument("--config", default="config.json", help="Path to config.json")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(asyncio.run(run_backfill(
+        args.start, args.end, args.channels,
+        args.concurrency, args.checkpoint, args.config
+    )))
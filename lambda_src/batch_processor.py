@@ -0,0 +1,103 @@
+import json
+import logging
+from openai import AsyncOpenAI
+from checkpoint import STAGE_BATCH_SUBMITTED
+from datetime import datetime
+from langchain_core.messages import BaseMessage
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# "cancelling" batches get the output of their finished requests only once they are "cancelled"
+BATCH_PENDING_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+
+# LangChain message types mapped to OpenAI chat roles
+OPENAI_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+def pending_batches_key(source_channel_id: int) -> str:
+    """Checkpoint key under which a channel keeps its submitted, not yet collected batches."""
+    return f"pending_batches:{source_channel_id}"
+
+
+def build_batch_request(custom_id: str, prompt_messages: List[BaseMessage], llm_model_name: str,
+                        llm_temperature: float, response_format: Optional[Dict] = None) -> Dict:
+    """Builds one line of the batch input file: the same chat completion a real-time run would make."""
+    request = {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": llm_model_name,
+            "temperature": llm_temperature,
+            "messages": [{"role": OPENAI_ROLES[m.type], "content": m.content} for m in prompt_messages],
+        },
+    }
+    if response_format is not None:
+        request["body"]["response_format"] = response_format
+    return request
+
+
+async def submit_summary_batch(requests: List[Dict], openai_api_key: str, base_url: Optional[str] = None) -> str:
+    """Uploads the requests as a JSONL batch input file, creates the batch and returns its id."""
+    batch_input = "\n".join(json.dumps(request, ensure_ascii=False) for request in requests).encode("utf-8")
+
+    openai_client = AsyncOpenAI(api_key=openai_api_key, base_url=base_url)
+    input_file = await openai_client.files.create(file=("summary_batch.jsonl", batch_input), purpose="batch")
+    batch = await openai_client.batches.create(
+        input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW
+    )
+    return batch.id
+
+
+def parse_batch_output(batch_output: str) -> Dict[str, Optional[str]]:
+    """Maps custom_id to the generated text for every successful line of a batch output file."""
+    results = {}
+    for line in batch_output.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            logger.error(f"Batch request {result.get('custom_id')} failed: {result.get('error') or response}")
+            continue
+        results[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return results
+
+
+async def queue_channel_summary(channel_config: Dict, checkpoint, key: str, start_date: datetime,
+                                end_date: datetime, prompt_messages: List[BaseMessage], header: str,
+                                llm_model_name: str, llm_temperature: float, openai_api_key: str,
+                                base_url: Optional[str] = None, response_format: Optional[Dict] = None) -> str:
+    """Submits the channel's summarization as a batch and registers it, with what is needed to post the
+    result, under the channel's pending batches."""
+    request = build_batch_request(key, prompt_messages, llm_model_name, llm_temperature, response_format)
+    batch_id = await submit_summary_batch([request], openai_api_key, base_url)
+
+    pending = {
+        "keys": [key],
+        "headers": {key: header},
+        "windows": {key: [start_date.isoformat(), end_date.isoformat()]},
+        "structured": response_format is not None,
+    }
+    # Register the batch first: a window marked as submitted is never summarized again, so its batch must not
+    # get lost in between
+    checkpoint.mark(pending_batches_key(channel_config["SOURCE_CHANNEL_ID"]), batch_id,
+                    json.dumps(pending, ensure_ascii=False))
+    checkpoint.mark(key, STAGE_BATCH_SUBMITTED, batch_id)
+    return batch_id
+
+
+async def retrieve_batch_results(batch_id: str, openai_api_key: str,
+                                 base_url: Optional[str] = None) -> Tuple[str, Optional[Dict[str, Optional[str]]]]:
+    """Returns the batch status and, once it has finished, its results by custom_id. Batches that expired or
+    were cancelled keep the results of the requests finished until then; the results are None without any."""
+    openai_client = AsyncOpenAI(api_key=openai_api_key, base_url=base_url)
+    batch = await openai_client.batches.retrieve(batch_id)
+    if batch.status in BATCH_PENDING_STATUSES or not batch.output_file_id:
+        return batch.status, None
+
+    batch_output = await openai_client.files.content(batch.output_file_id)
+    return batch.status, parse_batch_output(batch_output.text)
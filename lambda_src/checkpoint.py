@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import time
+import boto3
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# Stages of a (channel, window) pair, recorded in this order
+STAGE_FETCHED = "fetched"  # value: number of fetched messages
+STAGE_BATCH_SUBMITTED = "batch_submitted"  # value: OpenAI batch id, for channels in batch mode
+STAGE_SUMMARIZED = "summarized"  # value: summary text, so a retry doesn't pay for the LLM call again
+STAGE_POSTED = "posted"
+STAGE_IMAGE_POSTED = "image_posted"
+# Not a stage: JSON list of the topic titles of a structured summary, reused for the illustration on retries
+SUMMARY_TOPICS = "summary_topics"
+
+DEFAULT_LOCAL_CHECKPOINT_PATH = "/tmp/chat_summarizer_checkpoint.json"
+DEFAULT_CHECKPOINT_TTL_DAYS = 30
+
+
+def checkpoint_key(source_channel_id: int, window_start: datetime, window_end: datetime) -> str:
+    """Checkpoint key of a single (channel, window) pair."""
+    return f"{source_channel_id}:{window_start.isoformat()}:{window_end.isoformat()}"
+
+
+class LocalFileCheckpointStore:
+    """Keeps all checkpoints in one JSON file. Meant for local runs and backfills."""
+
+    def __init__(self, path: str = DEFAULT_LOCAL_CHECKPOINT_PATH):
+        self.path = path
+        self._checkpoints: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._checkpoints is None:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._checkpoints = json.load(f)
+            else:
+                self._checkpoints = {}
+        return self._checkpoints
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._checkpoints, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Dict[str, Any]:
+        """Returns the finished stages of a key as {stage: value}."""
+        return dict(self._load().get(key, {}))
+
+    def mark(self, key: str, stage: str, value: Any = True) -> None:
+        """Records a finished stage and atomically rewrites the file."""
+        self._load().setdefault(key, {})[stage] = value
+        self._save()
+
+    def unmark(self, key: str, stage: str) -> None:
+        """Forgets a stage."""
+        checkpoints = self._load()
+        if checkpoints.get(key, {}).pop(stage, None) is not None:
+            self._save()
+
+
+class DynamoDBCheckpointStore:
+    """Keeps one item per key with one attribute per finished stage. Items expire via DynamoDB TTL."""
+
+    def __init__(self, table_name: str, region_name: str = "us-west-2", endpoint_url: Optional[str] = None,
+                 ttl_days: int = DEFAULT_CHECKPOINT_TTL_DAYS):
+        self.table = boto3.resource("dynamodb", region_name=region_name, endpoint_url=endpoint_url).Table(table_name)
+        self.ttl_days = ttl_days
+
+    def get(self, key: str) -> Dict[str, Any]:
+        """Returns the finished stages of a key as {stage: value}."""
+        item = self.table.get_item(Key={"checkpoint_key": key}, ConsistentRead=True).get("Item", {})
+        item.pop("checkpoint_key", None)
+        item.pop("expires_at", None)
+        # DynamoDB returns numbers as Decimal
+        return {stage: int(value) if isinstance(value, Decimal) else value for stage, value in item.items()}
+
+    def mark(self, key: str, stage: str, value: Any = True) -> None:
+        """Records a finished stage with a single atomic update."""
+        self.table.update_item(
+            Key={"checkpoint_key": key},
+            UpdateExpression="SET #stage = :value, expires_at = :expires_at",
+            ExpressionAttributeNames={"#stage": stage},
+            ExpressionAttributeValues={":value": value, ":expires_at": int(time.time()) + self.ttl_days * 86400},
+        )
+
+    def unmark(self, key: str, stage: str) -> None:
+        """Forgets a stage."""
+        self.table.update_item(
+            Key={"checkpoint_key": key},
+            UpdateExpression="REMOVE #stage",
+            ExpressionAttributeNames={"#stage": stage},
+        )
+
+
+class S3CheckpointStore:
+    """Keeps one JSON object per key. Works with any S3-compatible storage through `endpoint_url`."""
+
+    def __init__(self, bucket: str, prefix: str = "checkpoints/", region_name: str = "us-west-2",
+                 endpoint_url: Optional[str] = None):
+        self.s3 = boto3.client("s3", region_name=region_name, endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, key: str) -> Dict[str, Any]:
+        """Returns the finished stages of a key as {stage: value}."""
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                return {}
+            raise
+        return json.loads(response["Body"].read())
+
+    def _put(self, key: str, stages: Dict[str, Any]) -> None:
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json",
+                           Body=json.dumps(stages, ensure_ascii=False).encode("utf-8"),
+                           ContentType="application/json")
+
+    def mark(self, key: str, stage: str, value: Any = True) -> None:
+        """Records a finished stage. Each key is only written by the task processing its channel."""
+        stages = self.get(key)
+        stages[stage] = value
+        self._put(key, stages)
+
+    def unmark(self, key: str, stage: str) -> None:
+        """Forgets a stage."""
+        stages = self.get(key)
+        if stages.pop(stage, None) is not None:
+            self._put(key, stages)
+
+
+def create_checkpoint_store(config: Dict):
+    """Creates the checkpoint store selected by CHECKPOINT_BACKEND in config.json ("local", "dynamodb", "s3"
+    or "none"). Returns None when checkpointing is disabled."""
+    backend = config.get("CHECKPOINT_BACKEND", "local")
+    region_name = config.get("CHECKPOINT_REGION", "us-west-2")
+    endpoint_url = config.get("CHECKPOINT_ENDPOINT_URL")  # e.g. DynamoDB Local or MinIO
+
+    if backend == "none":
+        return None
+    if backend == "local":
+        return LocalFileCheckpointStore(config.get("CHECKPOINT_PATH", DEFAULT_LOCAL_CHECKPOINT_PATH))
+    if backend == "dynamodb":
+        return DynamoDBCheckpointStore(config["CHECKPOINT_TABLE"], region_name, endpoint_url,
+                                       int(config.get("CHECKPOINT_TTL_DAYS", DEFAULT_CHECKPOINT_TTL_DAYS)))
+    if backend == "s3":
+        return S3CheckpointStore(config["CHECKPOINT_BUCKET"], config.get("CHECKPOINT_PREFIX", "checkpoints/"),
+                                 region_name, endpoint_url)
+    raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
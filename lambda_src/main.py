@@ -1,7 +1,9 @@
 import logging
 import asyncio
-from utils import get_secrets, load_config, initialize_telegram_client
-from telegram_processor import process_channel
+from checkpoint import create_checkpoint_store
+from summary_index import DEFAULT_SUMMARY_INDEX_PATH
+from utils import get_secrets, load_config, initialize_telegram_client, get_run_time, DEFAULT_RUN_HOUR_UTC
+from telegram_processor import process_channel, collect_summary_batches
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,9 +26,18 @@ async def async_main(event: dict, context) -> dict:
         llm_temperature = float(config.get("LLM_TEMPERATURE", 0.0))
         llm_image_model_name = config.get("LLM_IMAGE_MODEL_NAME", "dall-e-3")
         reader_timezone = config.get("READER_TIMEZONE", "US/Central")
+        run_time = get_run_time(event, int(config.get("RUN_HOUR_UTC", DEFAULT_RUN_HOUR_UTC)))
+        checkpoint = create_checkpoint_store(config)
+        openai_batch_base_url = config.get("OPENAI_BATCH_BASE_URL")
+        summary_index_path = config.get("SUMMARY_INDEX_PATH", DEFAULT_SUMMARY_INDEX_PATH)
 
         client = await initialize_telegram_client(secrets)
 
+        # Post batches submitted by earlier runs first, so no channel task races with them on a checkpoint
+        if checkpoint is not None:
+            await collect_summary_batches(client, config["channels"], checkpoint, secrets, llm_image_model_name,
+                                          system_channel_id, openai_batch_base_url, summary_index_path)
+
         tasks = []
         for channel_config in config["channels"]:
             if channel_config.get("ENABLED", 1) == 0:
@@ -35,7 +46,8 @@ async def async_main(event: dict, context) -> dict:
                 tasks.append(
                     process_channel(
                         client, channel_config, secrets, num_of_messages_limit,
-                        llm_model_name, llm_temperature, reader_timezone, llm_image_model_name, system_channel_id
+                        llm_model_name, llm_temperature, reader_timezone, llm_image_model_name, system_channel_id,
+                        run_time, checkpoint, openai_batch_base_url, summary_index_path
                     )
                 )
 
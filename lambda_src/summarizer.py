@@ -1,19 +1,136 @@
+import json
 import logging
 import aiohttp
 from pytz import timezone
-from langchain.prompts.chat import (
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    ChatPromptTemplate,
-)
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from telethon.tl.custom.message import Message
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Prefix of the text returned by summarize_messages when the LLM call fails
+SUMMARY_ERROR_PREFIX = "**[Error occurred during summarization"
+
+SYSTEM_PROMPT = (
+    "Вы являетесь помощником, который резюмирует активность канала Telegram. "
+    "Сосредоточьтесь на том, какие темы обсуждались и кем."
+)
+INSTRUCTIONS_PROMPT = (
+    "Резюмируйте следующий разговор на русском языке. "
+    "Включите, какие темы обсуждались и кем (имена участников)."
+)
+FRIDAY_PROMPT = (
+    "Резюме должно быть сгенереровано в шуточном виде в виде прожарки участников чата. "
+    "Резюме должно начинаться с фразы - Happy Friday y'all! ;)"
+)
+
+STRUCTURED_INSTRUCTIONS_PROMPT = (
+    "Верните резюме в формате JSON по заданной схеме. Для каждой темы укажите заголовок, краткое резюме, "
+    "участников, номера первого и последнего сообщения темы (число в квадратных скобках перед сообщением) "
+    "и ключевые ссылки из обсуждения."
+)
+
+# Built once at import and always sent first. Only static text goes here, so the prompt prefix is identical
+# across channels and runs and OpenAI's automatic prompt caching can reuse it.
+STATIC_PROMPT_PREFIX = (
+    SystemMessage(content=SYSTEM_PROMPT),
+    HumanMessage(content=INSTRUCTIONS_PROMPT),
+)
+STRUCTURED_PROMPT_PREFIX = STATIC_PROMPT_PREFIX + (HumanMessage(content=STRUCTURED_INSTRUCTIONS_PROMPT),)
+
+# Structured summaries are requested in the same LLM call through OpenAI structured outputs
+SUMMARY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "chat_summary",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "topics": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "title": {"type": "string"},
+                            "summary": {"type": "string"},
+                            "participants": {"type": "array", "items": {"type": "string"}},
+                            "first_message_id": {"type": "integer"},
+                            "last_message_id": {"type": "integer"},
+                            "links": {"type": "array", "items": {"type": "string"}},
+                        },
+                        "required": ["title", "summary", "participants", "first_message_id", "last_message_id",
+                                     "links"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["topics"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def format_conversation(messages: List[Message], with_ids: bool = False) -> str:
+    """Renders messages as "Sender Name: text" lines, prefixed with "[message id]" if requested."""
+    conversation_text = []
+    for msg in messages:
+        sender = msg.sender
+        sender_name = (
+            f"{sender.first_name or ''} {sender.last_name or ''}".strip()
+            if sender else "Unknown"
+        )
+        message_text = msg.text or "<no text>"
+        if with_ids:
+            conversation_text.append(f"[{msg.id}] {sender_name}: {message_text}")
+        else:
+            conversation_text.append(f"{sender_name}: {message_text}")
+    return "\n".join(conversation_text)
+
+
+def build_prompt_messages(conversation_text: str, period_text: str, friday_mode: bool = False,
+                          structured: bool = False) -> List[BaseMessage]:
+    """Appends the variable parts of the prompt to the static prefix. They are passed as plain messages, not
+    as template text, so braces in the chat are sent as-is."""
+    prompt_messages = list(STRUCTURED_PROMPT_PREFIX if structured else STATIC_PROMPT_PREFIX)
+    if friday_mode:
+        prompt_messages.append(HumanMessage(content=FRIDAY_PROMPT))
+    prompt_messages.append(HumanMessage(content=f"Период: {period_text}\nРазговор:\n{conversation_text}"))
+    return prompt_messages
+
+
+def prepare_summary_prompt(
+        messages: List[Message],
+        start_date: datetime,
+        end_date: datetime,
+        reader_timezone: str,
+        structured: bool = False
+) -> Tuple[List[BaseMessage], str]:
+    """Returns the prompt messages and the metadata header that is put above the generated summary."""
+    user_tz = timezone(reader_timezone)
+    start_text = start_date.astimezone(user_tz).strftime('%Y-%m-%d %H:%M:%S')
+    end_text = end_date.astimezone(user_tz).strftime('%Y-%m-%d %H:%M:%S')
+
+    # Friday edition mode: a window ending on Saturday (UTC time) covers Friday (CET)
+    friday_mode = end_date.astimezone(timezone("UTC")).weekday() == 5
+    prompt_messages = build_prompt_messages(format_conversation(messages, with_ids=structured),
+                                            f"{start_text} - {end_text}", friday_mode, structured)
+
+    time_period = f"**Time period:** {start_text} to {end_text}"
+    message_count_text = f"**Number of messages:** {len(messages)}"
+    return prompt_messages, f"{time_period}\n{message_count_text}"
+
+
+def format_summary(header: str, summary_text: Optional[str]) -> str:
+    """Puts the metadata header above the LLM output."""
+    # Ensure response is a valid string
+    summary_text = summary_text or "**[No meaningful summary generated]**"
+    return f"{header}\n\n{summary_text}"
+
 
 def summarize_messages(
         messages: List[Message],
@@ -30,43 +147,7 @@ def summarize_messages(
             logger.info("No messages to summarize.")
             return "**[No meaningful messages were found to summarize]**"
 
-        user_tz = timezone(reader_timezone)
-        start_date_tz = start_date.astimezone(user_tz)
-        end_date_tz = end_date.astimezone(user_tz)
-
-        # Prepare conversation text
-        conversation_text = []
-        for msg in messages:
-            sender = msg.sender
-            sender_name = (
-                f"{sender.first_name or ''} {sender.last_name or ''}".strip()
-                if sender else "Unknown"
-            )
-            message_text = msg.text or "<no text>"
-            conversation_text.append(f"{sender_name}: {message_text}")
-
-        conversation_str = "\n".join(conversation_text)
-
-        # Define the prompt
-        system_template = """Вы являетесь помощником, который резюмирует активность канала Telegram. 
-        Сосредоточьтесь на том, какие темы обсуждались и кем."""
-        human_template = """Резюмируйте следующий разговор на русском языке.
-        Включите, какие темы обсуждались и кем (имена участников)."""
-
-        # Friday edition mode
-        if datetime.today().weekday() == 5:  # 5 corresponds to Saturday (UTC time), Friday (CET)
-            human_template += """Резюме должно быть сгенереровано в шуточном виде в виде прожарки участников чата.
-            Резюме должно начинаться с фразы - Happy Friday y'all! ;)"""
-
-        human_template += f"""
-        Период: {start_date_tz.strftime('%Y-%m-%d %H:%M:%S')} - {end_date_tz.strftime('%Y-%m-%d %H:%M:%S')}
-        Разговор:
-        {conversation_str}"""
-
-        # Create LangChain prompts
-        system_prompt = SystemMessagePromptTemplate.from_template(system_template)
-        human_prompt = HumanMessagePromptTemplate.from_template(human_template)
-        chat_prompt = ChatPromptTemplate.from_messages([system_prompt, human_prompt])
+        prompt_messages, header = prepare_summary_prompt(messages, start_date, end_date, reader_timezone)
 
         # Summarize using OpenAI
         chat_llm = ChatOpenAI(
@@ -74,40 +155,106 @@ def summarize_messages(
             temperature=llm_temperature,
             openai_api_key=openai_api_key
         )
-        prompt_messages = chat_prompt.format_prompt(conversation=conversation_str).to_messages()
         response = chat_llm.invoke(prompt_messages)
 
-        # Ensure response is a valid string
-        summary_text = response.content if response and response.content else "**[No meaningful summary generated]**"
+        return format_summary(header, response.content if response else None)
+
+    except Exception as e:
+        error_message = f"Error summarizing messages: {e}"
+        logger.error(error_message)
+        return f"{SUMMARY_ERROR_PREFIX}: {e}]**"
+
+
+def render_summary_markdown(summary_data: Dict) -> str:
+    """Renders a structured summary as Telegram markdown."""
+    sections = []
+    for topic in summary_data.get("topics", []):
+        lines = [f"**{topic['title']}**", topic["summary"]]
+        if topic.get("participants"):
+            lines.append(f"__Participants:__ {', '.join(topic['participants'])}")
+        lines.append(f"__Messages:__ {topic['first_message_id']}–{topic['last_message_id']}")
+        lines.extend(topic.get("links", []))
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def topic_titles(summary_data: Dict) -> List[str]:
+    """Returns the titles of the topics of a structured summary."""
+    return [topic["title"] for topic in summary_data.get("topics", [])]
 
-        # Add metadata to the summary
-        message_count = len(messages)
-        time_period = f"**Time period:** {start_date_tz.strftime('%Y-%m-%d %H:%M:%S')} to {end_date_tz.strftime(
-            '%Y-%m-%d %H:%M:%S')}"
-        message_count_text = f"**Number of messages:** {message_count}"
-        return f"{time_period}\n{message_count_text}\n\n{summary_text}"
+
+def parse_structured_summary(header: str, content: Optional[str]) -> Tuple[str, Optional[Dict]]:
+    """Parses the JSON produced for SUMMARY_RESPONSE_FORMAT. Returns the rendered summary and the structured
+    summary, or None if nothing was generated."""
+    if not content:
+        return format_summary(header, None), None
+    summary_data = json.loads(content)
+    return format_summary(header, render_summary_markdown(summary_data)), summary_data
+
+
+def summarize_messages_structured(
+        messages: List[Message],
+        start_date: datetime,
+        end_date: datetime,
+        llm_model_name: str,
+        llm_temperature: float,
+        reader_timezone: str,
+        openai_api_key: str
+) -> Tuple[str, Optional[Dict]]:
+    """Summarizes a list of messages as SUMMARY_RESPONSE_FORMAT JSON. Returns the summary rendered as Telegram
+    markdown and the structured summary, which is None if nothing was summarized."""
+    try:
+        if not messages:  # Handle case when there are no messages
+            logger.info("No messages to summarize.")
+            return "**[No meaningful messages were found to summarize]**", None
+
+        prompt_messages, header = prepare_summary_prompt(messages, start_date, end_date, reader_timezone,
+                                                         structured=True)
+
+        chat_llm = ChatOpenAI(
+            model_name=llm_model_name,
+            temperature=llm_temperature,
+            openai_api_key=openai_api_key
+        )
+        response = chat_llm.invoke(prompt_messages, response_format=SUMMARY_RESPONSE_FORMAT)
+
+        return parse_structured_summary(header, response.content if response else None)
 
     except Exception as e:
         error_message = f"Error summarizing messages: {e}"
         logger.error(error_message)
-        return f"**[Error occurred during summarization: {e}]**"
+        return f"{SUMMARY_ERROR_PREFIX}: {e}]**", None
 
 
-async def generate_image(summary_text: str, image_model_name: str, openai_api_key: str) -> str:
-    """Asynchronously generates an image using OpenAI's API based on summary text."""
+async def generate_image(summary_text: str, image_model_name: str, openai_api_key: str,
+                         topics: Optional[List[str]] = None) -> str:
+    """Asynchronously generates an image using OpenAI's API based on summary text, or on the topics of a
+    structured summary when they are given."""
     try:
         # Define the prompt
+        if topics:
+            subject = (
+                f"Create a cozy painterly-style illustration with soft textures and warm, inviting tones. "
+                f"The image should be divided into separate segments, each representing one of these topics: "
+                f"{'; '.join(topics[:3])}. "
+            )
+        else:
+            subject = (
+                "Extract and identify up to 3 key topics from the summary provided below, "
+                "then create a cozy painterly-style illustration with soft textures and warm, inviting tones. "
+                "The image should be divided into separate segments, each representing one of the identified "
+                "topics. "
+            )
         image_prompt = (
-            f"Extract and identify up to 3 key topics from the summary provided below, "
-            f"then create a cozy painterly-style illustration with soft textures and warm, inviting tones. "
-            f"The image should be divided into separate segments, each representing one of the identified topics. "
+            f"{subject}"
             f"Focus solely on illustrating the discussed items (e.g., cars, food, or objects) rather than including "
             f"people."
             f"Do not include text, captions, or labels in the illustration. "
             f"Use subtle, natural lighting and rich, warm colors to evoke a sense of comfort and harmony, "
-            f"with no overly modern or abstract elements.\n\n"
-            f"<summary>{summary_text}</summary>"
+            f"with no overly modern or abstract elements."
         )
+        if not topics:
+            image_prompt += f"\n\n<summary>{summary_text}</summary>"
 
         async with aiohttp.ClientSession() as session:
             async with session.post(
@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUMMARY_INDEX_PATH = "/tmp/summary_index.jsonl"
+
+
+def append_to_summary_index(index_path: str, source_channel_id: int, channel_name: str, start_date: datetime,
+                            end_date: datetime, summary_data: Dict) -> None:
+    """Appends one JSON line per topic of a structured summary to the local index."""
+    with open(index_path, "a", encoding="utf-8") as f:
+        for topic in summary_data.get("topics", []):
+            entry = {
+                "source_channel_id": source_channel_id,
+                "channel_name": channel_name,
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                **topic,
+            }
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def search_summary_index(index_path: str, query: str, source_channel_id: Optional[int] = None) -> List[Dict]:
+    """Returns indexed topics whose title, summary or participants contain the query (case-insensitive),
+    oldest first."""
+    if not os.path.exists(index_path):
+        return []
+
+    query = query.casefold()
+    matches = []
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if source_channel_id is not None and entry["source_channel_id"] != source_channel_id:
+                continue
+            searchable = " ".join([entry["title"], entry["summary"], *entry["participants"]]).casefold()
+            if query in searchable:
+                matches.append(entry)
+    return matches
@@ -1,84 +1,294 @@
+import json
 import logging
+import os
+import tempfile
 import aiohttp
 from datetime import datetime, timedelta, timezone
-from summarizer import summarize_messages, generate_image
+from openai import NotFoundError
+from batch_processor import (
+    queue_channel_summary, retrieve_batch_results, pending_batches_key, BATCH_PENDING_STATUSES
+)
+from checkpoint import (
+    checkpoint_key, STAGE_FETCHED, STAGE_BATCH_SUBMITTED, STAGE_SUMMARIZED, STAGE_POSTED, STAGE_IMAGE_POSTED,
+    SUMMARY_TOPICS
+)
+from summarizer import (
+    summarize_messages, summarize_messages_structured, generate_image, prepare_summary_prompt, format_summary,
+    parse_structured_summary, topic_titles, SUMMARY_ERROR_PREFIX, SUMMARY_RESPONSE_FORMAT
+)
+from summary_index import append_to_summary_index
 from telethon import TelegramClient
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
 
+async def fetch_messages(client: TelegramClient, channel, start_date: datetime, end_date: datetime,
+                         num_of_messages_limit: Optional[int]) -> List:
+    """Fetches up to `num_of_messages_limit` most recent messages posted between start_date and end_date,
+    oldest first. A limit of None fetches the whole period."""
+    all_messages: List = []
+    # Pages after the first continue below the oldest message fetched so far. Paging by date would skip the
+    # messages sharing its second (e.g. albums), as offset_date is exclusive.
+    offset_id = 0
+    total_messages_fetched = 0
+
+    while True:
+        batch = await client.get_messages(channel, limit=100, offset_date=end_date, offset_id=offset_id)
+        if not batch:
+            break
+
+        for msg in batch:
+            if msg.date >= start_date:
+                all_messages.append(msg)
+            else:
+                break
+
+            total_messages_fetched += 1
+            if num_of_messages_limit is not None and total_messages_fetched >= num_of_messages_limit:
+                break
+
+        if batch[-1].date < start_date:
+            break
+        if num_of_messages_limit is not None and total_messages_fetched >= num_of_messages_limit:
+            break
+        offset_id = batch[-1].id
+
+    all_messages.reverse()
+    return all_messages
+
+
+async def send_summary_image(client: TelegramClient, summary_channel_id: int, summary_text: str,
+                             llm_image_model_name: str, openai_api_key: str,
+                             topics: Optional[List[str]] = None) -> None:
+    """Generates an illustration for the summary and posts it to the summary channel."""
+    image_url = await generate_image(summary_text, llm_image_model_name, openai_api_key, topics)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(image_url) as image_data:
+            if image_data.status == 200:
+                # Unique file per call, so that concurrent channels/windows don't overwrite each other's image
+                fd, image_path = tempfile.mkstemp(suffix=".png", prefix="summary_image_", dir="/tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(await image_data.read())
+                    await client.send_file(summary_channel_id, image_path, caption="Illustration for the summary "
+                                                                                   "above")
+                finally:
+                    os.remove(image_path)
+                logger.info("Image sent successfully.")
+
+
+async def publish_summary(client: TelegramClient, summary_channel_id: int, summary_text: str,
+                          generate_image_flag: int, llm_image_model_name: str, openai_api_key: str,
+                          checkpoint=None, key: Optional[str] = None, stages: Optional[Dict] = None,
+                          topics: Optional[List[str]] = None) -> None:
+    """Posts the summary (and its illustration, if enabled), skipping and recording stages in the checkpoint."""
+    stages = stages or {}
+    # Failed summaries are posted as before but never recorded, so a retry produces and posts a real one
+    record = checkpoint is not None and not summary_text.startswith(SUMMARY_ERROR_PREFIX)
+
+    if not stages.get(STAGE_POSTED):
+        await client.send_message(summary_channel_id, summary_text)
+        if record:
+            checkpoint.mark(key, STAGE_POSTED)
+
+    if generate_image_flag and not stages.get(STAGE_IMAGE_POSTED):
+        await send_summary_image(client, summary_channel_id, summary_text, llm_image_model_name, openai_api_key,
+                                 topics)
+        if record:
+            checkpoint.mark(key, STAGE_IMAGE_POSTED)
+
+
+def store_summary(checkpoint, key: str, summary_text: str, summary_data: Optional[Dict], channel_config: Dict,
+                  start_date: datetime, end_date: datetime, summary_index_path: Optional[str]) -> None:
+    """Checkpoints a freshly generated summary and adds it to the summary index if it is structured. The
+    checkpoint comes first: a retry never stores a checkpointed summary again, so it can't be indexed twice."""
+    if checkpoint is not None and not summary_text.startswith(SUMMARY_ERROR_PREFIX):
+        checkpoint.mark(key, STAGE_SUMMARIZED, summary_text)
+        if summary_data is not None:
+            checkpoint.mark(key, SUMMARY_TOPICS, json.dumps(topic_titles(summary_data), ensure_ascii=False))
+
+    if summary_data is not None and summary_index_path:
+        append_to_summary_index(summary_index_path, channel_config["SOURCE_CHANNEL_ID"],
+                                channel_config.get("SOURCE_CHANNEL_NAME", "Unknown"), start_date, end_date,
+                                summary_data)
+
+
+def checkpointed_topics(stages: Dict) -> Optional[List[str]]:
+    """Returns the topic titles stored with a checkpointed structured summary."""
+    return json.loads(stages[SUMMARY_TOPICS]) if stages.get(SUMMARY_TOPICS) else None
+
+
+def is_window_complete(stages: Dict, generate_image_flag: int) -> bool:
+    """Whether a (channel, window) checkpoint has nothing left to do."""
+    if stages.get(STAGE_FETCHED) == 0:
+        return True
+    return bool(stages.get(STAGE_POSTED)) and (not generate_image_flag or bool(stages.get(STAGE_IMAGE_POSTED)))
+
+
 async def process_channel(client: TelegramClient, channel_config: Dict, secrets: Dict[str, str],
                           num_of_messages_limit: int, llm_model_name: str, llm_temperature: float, reader_timezone: str,
-                          llm_image_model_name: str, system_channel_id: int) -> None:
+                          llm_image_model_name: str, system_channel_id: int, end_date: Optional[datetime] = None,
+                          checkpoint=None, openai_batch_base_url: Optional[str] = None,
+                          summary_index_path: Optional[str] = None) -> None:
     try:
         source_channel_id = channel_config["SOURCE_CHANNEL_ID"]
         summary_channel_id = channel_config["SUMMARY_CHANNEL_ID"]
         generate_image_flag = channel_config.get("GENERATE_IMAGE", 0)
         summary_period_hours = channel_config.get("SUMMARY_PERIOD_HOURS", 24)
+        summary_mode = channel_config.get("SUMMARY_MODE", "realtime")
+        structured = channel_config.get("SUMMARY_FORMAT", "text") == "structured"
+        channel_name = channel_config.get("SOURCE_CHANNEL_NAME", "Unknown")
+        if summary_mode == "batch" and checkpoint is None:
+            raise ValueError("SUMMARY_MODE 'batch' requires a CHECKPOINT_BACKEND to track submitted batches")
 
-        end_date = datetime.now(timezone.utc)
+        end_date = end_date or datetime.now(timezone.utc)
         start_date = end_date - timedelta(hours=summary_period_hours)
-        all_messages: List = []
 
-        channel = await client.get_entity(source_channel_id)
-        last_date = None
-        total_messages_fetched = 0
+        key = checkpoint_key(source_channel_id, start_date, end_date)
+        stages = checkpoint.get(key) if checkpoint is not None else {}
+        if is_window_complete(stages, generate_image_flag):
+            logger.info(f"Channel already processed for this period, skipping: {channel_name}")
+            return
 
-        while True:
-            batch = await client.get_messages(channel, limit=100, offset_date=last_date)
-            if not batch:
-                break
+        summary_text = stages.get(STAGE_SUMMARIZED)
+        if summary_text is None and stages.get(STAGE_BATCH_SUBMITTED):
+            logger.info(f"Summary batch already submitted for channel, waiting for results: {channel_name}")
+            return
 
-            for msg in batch:
-                if msg.date >= start_date:
-                    all_messages.append(msg)
-                else:
-                    break
+        if summary_text is None:
+            channel = await client.get_entity(source_channel_id)
+            all_messages = await fetch_messages(client, channel, start_date, end_date, num_of_messages_limit)
+            if checkpoint is not None:
+                checkpoint.mark(key, STAGE_FETCHED, len(all_messages))
 
-                total_messages_fetched += 1
-                if total_messages_fetched >= num_of_messages_limit:
-                    break
+            if not all_messages:
+                info_message = f"No new messages found for channel {channel_name}"
+                logger.info(info_message)
+                await client.send_message(system_channel_id, info_message)
+                return
 
-            last_date = batch[-1].date if batch else None
-            if last_date and last_date < start_date:
-                break
-            if total_messages_fetched >= num_of_messages_limit:
-                break
+            if summary_mode == "batch":
+                prompt_messages, header = prepare_summary_prompt(all_messages, start_date, end_date, reader_timezone,
+                                                                 structured)
+                batch_id = await queue_channel_summary(
+                    channel_config, checkpoint, key, start_date, end_date, prompt_messages, header,
+                    llm_model_name, llm_temperature, secrets["OPENAI_API_KEY"], openai_batch_base_url,
+                    SUMMARY_RESPONSE_FORMAT if structured else None
+                )
+                logger.info(f"Summary batch {batch_id} submitted for channel: {channel_name}")
+                return
 
-        all_messages.reverse()
+            logger.info(f"Generating summary for channel: {channel_name}")
+            summary_data = None
+            if structured:
+                summary_text, summary_data = summarize_messages_structured(
+                    all_messages, start_date, end_date,
+                    llm_model_name, llm_temperature, reader_timezone,
+                    secrets["OPENAI_API_KEY"]
+                )
+            else:
+                summary_text = summarize_messages(
+                    all_messages, start_date, end_date,
+                    llm_model_name, llm_temperature, reader_timezone,
+                    secrets["OPENAI_API_KEY"]
+                )
 
-        if not all_messages:
-            info_message = f"No new messages found for channel {channel_config.get('SOURCE_CHANNEL_NAME', 'Unknown')}"
-            logger.info(info_message)
-            await client.send_message(system_channel_id, info_message)
-            return
+            if not summary_text.strip():
+                summary_text = "**[No meaningful messages were found to summarize]**"
 
-        logger.info(f"Generating summary for channel: {channel_config.get('SOURCE_CHANNEL_NAME', 'Unknown')}")
-        summary_text = summarize_messages(
-            all_messages, start_date, end_date,
-            llm_model_name, llm_temperature, reader_timezone,
-            secrets["OPENAI_API_KEY"]
-        )
+            store_summary(checkpoint, key, summary_text, summary_data, channel_config, start_date, end_date,
+                          summary_index_path)
+            topics = topic_titles(summary_data) if summary_data else None
+        else:
+            logger.info(f"Reusing checkpointed summary for channel: {channel_name}")
+            topics = checkpointed_topics(stages)
 
-        if not summary_text.strip():
-            summary_text = "**[No meaningful messages were found to summarize]**"
-
-        await client.send_message(summary_channel_id, summary_text)
-        logger.info(f"Summary sent to channel: {channel_config.get('SOURCE_CHANNEL_NAME', 'Unknown')}")
-
-        if generate_image_flag:
-            logger.info(f"Generating image for channel: {channel_config.get('SOURCE_CHANNEL_NAME', 'Unknown')}")
-            image_url = await generate_image(summary_text, llm_image_model_name, secrets["OPENAI_API_KEY"])
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as image_data:
-                    if image_data.status == 200:
-                        image_path = "/tmp/summary_image.png"
-                        with open(image_path, "wb") as f:
-                            f.write(await image_data.read())
-                        await client.send_file(summary_channel_id, image_path, caption="Illustration for the summary "
-                                                                                       "above")
-                        logger.info("Image sent successfully.")
+        await publish_summary(client, summary_channel_id, summary_text, generate_image_flag, llm_image_model_name,
+                              secrets["OPENAI_API_KEY"], checkpoint, key, stages, topics)
+        logger.info(f"Summary sent to channel: {channel_name}")
     except Exception as e:
-        logger.error(f"Error processing channel: {e}")
\ No newline at end of file
+        logger.error(f"Error processing channel: {e}")
+
+
+async def collect_summary_batch(client: TelegramClient, channel_config: Dict, checkpoint, secrets: Dict[str, str],
+                                llm_image_model_name: str, system_channel_id: int, batch_id: str, pending: str,
+                                openai_batch_base_url: Optional[str] = None,
+                                summary_index_path: Optional[str] = None) -> None:
+    """Posts the results of one pending summary batch once it has finished and unregisters it. Results that are
+    missing or can't be parsed are reported to the system channel, as is a batch that didn't complete."""
+    channel_name = channel_config.get("SOURCE_CHANNEL_NAME", "Unknown")
+    status, results = await retrieve_batch_results(batch_id, secrets["OPENAI_API_KEY"], openai_batch_base_url)
+    if status in BATCH_PENDING_STATUSES:
+        logger.info(f"Summary batch {batch_id} for channel {channel_name} is still {status}")
+        return
+
+    pending = json.loads(pending)
+    results = results or {}
+    for key in pending["keys"]:
+        stages = checkpoint.get(key)
+        summary_text = stages.get(STAGE_SUMMARIZED)
+        topics = checkpointed_topics(stages)
+        if summary_text is None:
+            if key not in results:
+                if status == "completed":  # Otherwise the batch as a whole is reported below
+                    error_message = f"Summary batch {batch_id} for channel {channel_name} has no result for {key}"
+                    logger.error(error_message)
+                    await client.send_message(system_channel_id, error_message)
+                continue
+            summary_data = None
+            if pending["structured"]:
+                try:
+                    summary_text, summary_data = parse_structured_summary(pending["headers"][key], results[key])
+                except ValueError as e:  # e.g. JSON cut off at the token limit
+                    error_message = f"Summary batch {batch_id} for channel {channel_name} has an invalid result " \
+                                    f"for {key}: {e}"
+                    logger.error(error_message)
+                    await client.send_message(system_channel_id, error_message)
+                    continue
+            else:
+                summary_text = format_summary(pending["headers"][key], results[key])
+            start_date, end_date = (datetime.fromisoformat(d) for d in pending["windows"][key])
+            store_summary(checkpoint, key, summary_text, summary_data, channel_config, start_date, end_date,
+                          summary_index_path)
+            topics = topic_titles(summary_data) if summary_data else None
+
+        await publish_summary(client, channel_config["SUMMARY_CHANNEL_ID"], summary_text,
+                              channel_config.get("GENERATE_IMAGE", 0), llm_image_model_name,
+                              secrets["OPENAI_API_KEY"], checkpoint, key, stages, topics)
+        logger.info(f"Batch summary sent to channel: {channel_name}")
+
+    if status != "completed":
+        error_message = f"Summary batch {batch_id} for channel {channel_name} ended as {status}"
+        logger.error(error_message)
+        await client.send_message(system_channel_id, error_message)
+    checkpoint.unmark(pending_batches_key(channel_config["SOURCE_CHANNEL_ID"]), batch_id)
+
+
+async def collect_summary_batches(client: TelegramClient, channels: List[Dict], checkpoint, secrets: Dict[str, str],
+                                  llm_image_model_name: str, system_channel_id: int,
+                                  openai_batch_base_url: Optional[str] = None,
+                                  summary_index_path: Optional[str] = None) -> None:
+    """Posts the results of summary batches submitted by earlier runs. Unfinished batches are left for the
+    next run; failed or expired ones are reported to the system channel, after posting any results they have.
+    A batch that fails to collect doesn't hold up the others."""
+    for channel_config in channels:
+        channel_name = channel_config.get("SOURCE_CHANNEL_NAME", "Unknown")
+        try:
+            registry_key = pending_batches_key(channel_config["SOURCE_CHANNEL_ID"])
+            for batch_id, pending in checkpoint.get(registry_key).items():
+                try:
+                    await collect_summary_batch(client, channel_config, checkpoint, secrets, llm_image_model_name,
+                                                system_channel_id, batch_id, pending, openai_batch_base_url,
+                                                summary_index_path)
+                except NotFoundError as e:
+                    # OpenAI no longer knows the batch, so later runs can't collect it either
+                    error_message = f"Summary batch {batch_id} for channel {channel_name} was not found: {e}"
+                    logger.error(error_message)
+                    await client.send_message(system_channel_id, error_message)
+                    checkpoint.unmark(registry_key, batch_id)
+                except Exception as e:
+                    logger.error(f"Error collecting summary batch {batch_id} for channel {channel_name}: {e}")
+        except Exception as e:
+            logger.error(f"Error collecting summary batches for channel {channel_name}: {e}")
@@ -2,6 +2,7 @@ import json
 import logging
 import boto3
 import os
+from datetime import datetime, timedelta, timezone
 from typing import Dict
 from dotenv import load_dotenv
 from telethon import TelegramClient
@@ -11,6 +12,8 @@ from telethon.sessions import StringSession
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_RUN_HOUR_UTC = 4  # Hour of the daily EventBridge schedule in main.tf
+
 
 def get_secrets() -> Dict[str, str]:
     """Fetch secrets from AWS Systems Manager Parameter Store if running in Lambda, or from .env for local execution."""
@@ -62,6 +65,24 @@ def load_config(config_path: str) -> Dict:
         raise
 
 
+def floor_to_run_hour(time: datetime, run_hour_utc: int = DEFAULT_RUN_HOUR_UTC) -> datetime:
+    """Return the last daily schedule slot (`run_hour_utc`:00 UTC) at or before the given time."""
+    time = time.astimezone(timezone.utc)
+    slot = time.replace(hour=run_hour_utc, minute=0, second=0, microsecond=0)
+    if slot > time:
+        slot -= timedelta(days=1)
+    return slot
+
+
+def get_run_time(event: dict, run_hour_utc: int = DEFAULT_RUN_HOUR_UTC) -> datetime:
+    """Return the daily schedule slot the run belongs to: the time of the EventBridge event, or now for manual
+    runs, floored to the last `run_hour_utc`:00 UTC. Retries and manual re-runs of the same day get the same
+    time, so their summary windows and checkpoints match."""
+    event_time = event.get("time") if isinstance(event, dict) else None
+    run_time = datetime.fromisoformat(event_time) if event_time else datetime.now(timezone.utc)
+    return floor_to_run_hour(run_time, run_hour_utc)
+
+
 async def initialize_telegram_client(secrets: Dict[str, str]) -> TelegramClient:
     """Initialize and connect to the Telegram client securely."""
     try:
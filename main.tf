@@ -61,6 +61,40 @@ resource "aws_iam_role_policy" "lambda_ssm_access" {
   })
 }
 
+# DynamoDB table for per-run checkpoints, so retried runs skip finished channels
+resource "aws_dynamodb_table" "checkpoints" {
+  name         = "chat_summarizer_checkpoints"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "checkpoint_key"
+
+  attribute {
+    name = "checkpoint_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Grant Lambda access to the checkpoints table
+resource "aws_iam_role_policy" "lambda_checkpoints_access" {
+  name   = "chat_summarizer_lambda_checkpoints_policy"
+  role   = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:GetItem", "dynamodb:UpdateItem"]
+        Resource = aws_dynamodb_table.checkpoints.arn
+      }
+    ]
+  })
+}
+
 resource "aws_iam_role_policy_attachment" "lambda_basic_execution" {
   role       = aws_iam_role.lambda_role.name
   policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
@@ -81,7 +115,8 @@ resource "aws_lambda_function" "chat_summarizer_lambda" {
 
   depends_on = [
     aws_iam_role_policy_attachment.lambda_basic_execution,
-    aws_iam_role_policy.lambda_ssm_access
+    aws_iam_role_policy.lambda_ssm_access,
+    aws_iam_role_policy.lambda_checkpoints_access
   ]
 }
 
@@ -0,0 +1,151 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, AsyncMock, MagicMock
+from lambda_src.backfill import build_windows, slice_messages, backfill_channel, run_backfill
+from lambda_src.checkpoint import LocalFileCheckpointStore, checkpoint_key
+from lambda_src.summarizer import FRIDAY_PROMPT
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def create_fake_message(date):
+    msg = MagicMock()
+    msg.date = date
+    msg.text = f"Message at {date}"
+    return msg
+
+
+def test_build_windows():
+    """ Test that the range is split into consecutive windows with a shorter last window."""
+    windows = build_windows(START, START + timedelta(hours=60), 24)
+
+    assert windows == [
+        (START, START + timedelta(hours=24)),
+        (START + timedelta(hours=24), START + timedelta(hours=48)),
+        (START + timedelta(hours=48), START + timedelta(hours=60)),
+    ]
+
+
+def test_build_windows_full_windows_only():
+    """ Test that the trailing partial window is left out when only complete windows are requested."""
+    windows = build_windows(START, START + timedelta(hours=60), 24, full_windows_only=True)
+
+    assert windows == [
+        (START, START + timedelta(hours=24)),
+        (START + timedelta(hours=24), START + timedelta(hours=48)),
+    ]
+
+
+def test_slice_messages_keeps_most_recent_per_window():
+    """ Test that messages land in their window and each window is capped to the most recent messages."""
+    windows = build_windows(START, START + timedelta(hours=48), 24)
+    messages = [create_fake_message(START + timedelta(hours=h)) for h in (1, 2, 3, 30)]
+
+    sliced = slice_messages(messages, windows, 2)
+
+    assert sliced[0] == messages[1:3]
+    assert sliced[1] == messages[3:]
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.backfill.summarize_messages", side_effect=lambda msgs, start, *_: f"Summary {start.day}")
+@patch("lambda_src.backfill.fetch_messages", new_callable=AsyncMock)
+async def test_backfill_channel_resumes_from_checkpoint(mock_fetch_messages, mock_summarize, tmp_path):
+    """ Test that posted windows are skipped, summarized windows are only posted, and the rest are
+    summarized and posted in chronological order."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    end_date = START + timedelta(days=4)
+    day = timedelta(days=1)
+    checkpoint.mark(checkpoint_key(-100123, START, START + day), "posted")
+    checkpoint.mark(checkpoint_key(-100123, START + day, START + 2 * day), "summarized", "Stored summary")
+    mock_fetch_messages.return_value = [create_fake_message(START + timedelta(days=d, hours=1)) for d in (2, 3)]
+    mock_client = AsyncMock()
+    channel_config = {"SOURCE_CHANNEL_ID": -100123, "SUMMARY_CHANNEL_ID": -100456, "SUMMARY_PERIOD_HOURS": 24}
+
+    await backfill_channel(mock_client, channel_config, {"OPENAI_API_KEY": "fake_key"}, START, end_date, 300,
+                           "gpt-4", 0.0, "UTC", "dall-e-3", asyncio.Semaphore(2), checkpoint)
+
+    mock_fetch_messages.assert_awaited_once_with(mock_client, mock_client.get_entity.return_value,
+                                                 START + 2 * day, end_date, None)
+    assert mock_summarize.call_count == 2
+    assert [c.args for c in mock_client.send_message.await_args_list] == [(-100456, "Stored summary"),
+                                                                          (-100456, "Summary 3"),
+                                                                          (-100456, "Summary 4")]
+    assert checkpoint.get(checkpoint_key(-100123, START + 3 * day, end_date)) == {
+        "fetched": 1, "summarized": "Summary 4", "posted": True
+    }
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.backfill.summarize_messages", return_value="**[Error occurred during summarization: boom]**")
+@patch("lambda_src.backfill.fetch_messages", new_callable=AsyncMock)
+async def test_backfill_channel_does_not_checkpoint_failed_window(mock_fetch_messages, _mock_summarize, tmp_path):
+    """ Test that a window whose summarization failed is neither posted nor marked summarized."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    mock_fetch_messages.return_value = [create_fake_message(START + timedelta(hours=1))]
+    mock_client = AsyncMock()
+    channel_config = {"SOURCE_CHANNEL_ID": -100123, "SUMMARY_CHANNEL_ID": -100456, "SUMMARY_PERIOD_HOURS": 24}
+
+    await backfill_channel(mock_client, channel_config, {"OPENAI_API_KEY": "fake_key"}, START,
+                           START + timedelta(days=1), 300, "gpt-4", 0.0, "UTC", "dall-e-3", asyncio.Semaphore(1),
+                           checkpoint)
+
+    mock_client.send_message.assert_not_awaited()
+    assert checkpoint.get(checkpoint_key(-100123, START, START + timedelta(days=1))) == {"fetched": 1}
+
+
+# backfill imports summarizer from lambda_src/ directly, so patch that module
+@pytest.mark.asyncio
+@patch("summarizer.ChatOpenAI")
+@patch("lambda_src.backfill.fetch_messages", new_callable=AsyncMock)
+async def test_backfill_channel_friday_mode_follows_window(mock_fetch_messages, mock_chat_openai, tmp_path):
+    """ Test that only the window ending on Saturday (UTC) gets the Friday prompt, whatever the current day."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    friday = datetime(2025, 1, 3, 4, tzinfo=timezone.utc)
+    mock_fetch_messages.return_value = [create_fake_message(friday + timedelta(days=d, hours=1)) for d in (0, 1)]
+    mock_chat_openai.return_value.invoke.return_value.content = "Summary"
+    mock_client = AsyncMock()
+    channel_config = {"SOURCE_CHANNEL_ID": -100123, "SUMMARY_CHANNEL_ID": -100456, "SUMMARY_PERIOD_HOURS": 24}
+
+    await backfill_channel(mock_client, channel_config, {"OPENAI_API_KEY": "fake_key"}, friday,
+                           friday + timedelta(days=2), 300, "gpt-4", 0.0, "UTC", "dall-e-3", asyncio.Semaphore(1),
+                           checkpoint)
+
+    prompts = {c.args[0][-1].content: c.args[0] for c in mock_chat_openai.return_value.invoke.call_args_list}
+    friday_windows = [text for text, prompt in prompts.items() if any(m.content == FRIDAY_PROMPT for m in prompt)]
+    assert len(prompts) == 2
+    assert len(friday_windows) == 1
+    assert "2025-01-04 04:00:00" in friday_windows[0].splitlines()[0]
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.backfill.get_secrets", return_value={"OPENAI_API_KEY": "fake_key"})
+@patch("lambda_src.backfill.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": [
+    {"SOURCE_CHANNEL_NAME": "Test Channel", "SOURCE_CHANNEL_ID": -100123, "SUMMARY_CHANNEL_ID": -100456}]})
+@patch("lambda_src.backfill.initialize_telegram_client", new_callable=AsyncMock)
+async def test_run_backfill_unknown_channel(mock_init_client, _mock_load_config, _mock_get_secrets, tmp_path):
+    """ Test that requesting a channel missing from config fails before connecting to Telegram."""
+    result = await run_backfill(START, START + timedelta(days=1), [-100999],
+                                checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    assert result == 1
+    mock_init_client.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.backfill.get_secrets", return_value={"OPENAI_API_KEY": "fake_key"})
+@patch("lambda_src.backfill.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": [
+    {"SOURCE_CHANNEL_NAME": "Test Channel", "SOURCE_CHANNEL_ID": -100123, "SUMMARY_CHANNEL_ID": -100456}]})
+@patch("lambda_src.backfill.initialize_telegram_client", new_callable=AsyncMock)
+@patch("lambda_src.backfill.backfill_channel", new_callable=AsyncMock)
+async def test_run_backfill_aligns_range_to_run_hour(mock_backfill_channel, _mock_init_client, _mock_load_config,
+                                                     _mock_get_secrets, tmp_path):
+    """ Test that the range is moved back to the daily run hour, so windows match the scheduled run's."""
+    result = await run_backfill(START, datetime(2025, 1, 3, 12, tzinfo=timezone.utc),
+                                checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    assert result == 0
+    start_date, end_date = mock_backfill_channel.await_args.args[3:5]
+    assert start_date == datetime(2024, 12, 31, 4, tzinfo=timezone.utc)
+    assert end_date == datetime(2025, 1, 3, 4, tzinfo=timezone.utc)
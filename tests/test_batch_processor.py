@@ -0,0 +1,223 @@
+import httpx
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+from openai import NotFoundError
+from lambda_src.batch_processor import build_batch_request, parse_batch_output, pending_batches_key
+from lambda_src.checkpoint import LocalFileCheckpointStore, checkpoint_key
+from lambda_src.summarizer import build_prompt_messages, SUMMARY_RESPONSE_FORMAT
+from lambda_src.telegram_processor import process_channel, collect_summary_batches
+from telethon import TelegramClient
+
+END_DATE = datetime(2025, 1, 2, 4, tzinfo=timezone.utc)
+MOCK_SECRETS = {"OPENAI_API_KEY": "fake_openai_key"}
+MOCK_CONFIG = {
+    "SOURCE_CHANNEL_NAME": "Test Channel",
+    "SOURCE_CHANNEL_ID": -100123456789,
+    "SUMMARY_CHANNEL_ID": -100987654321,
+    "SUMMARY_MODE": "batch",
+}
+KEY = checkpoint_key(-100123456789, END_DATE - timedelta(hours=24), END_DATE)
+
+
+class FakeBatchAPI:
+    """Local stand-in for the OpenAI files and batches endpoints. Batches with output (by default only completed
+    ones) answer every request with `summary_text`; batches it didn't create are not found."""
+
+    def __init__(self, status="completed", summary_text="Batch summary", has_output=None):
+        self.status = status
+        self.summary_text = summary_text
+        self.has_output = status == "completed" if has_output is None else has_output
+        self.uploaded = {}
+        self.created = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def __call__(self, **_kwargs):
+        # Used in place of the AsyncOpenAI constructor
+        return self
+
+    async def _create_file(self, file, purpose):
+        assert purpose == "batch"
+        file_id = f"file-{len(self.uploaded)}"
+        self.uploaded[file_id] = file[1].decode("utf-8")
+        return SimpleNamespace(id=file_id)
+
+    async def _create_batch(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{len(self.created)}"
+        self.created[batch_id] = input_file_id
+        return SimpleNamespace(id=batch_id, status="validating")
+
+    async def _retrieve_batch(self, batch_id):
+        if batch_id.startswith("batch-gone"):
+            request = httpx.Request("GET", f"https://api.openai.com/v1/batches/{batch_id}")
+            raise NotFoundError("No batch found", response=httpx.Response(404, request=request), body=None)
+        output_file_id = f"output-{batch_id}" if self.has_output else None
+        return SimpleNamespace(id=batch_id, status=self.status, output_file_id=output_file_id)
+
+    async def _file_content(self, file_id):
+        requests = self.uploaded[self.created[file_id.removeprefix("output-")]].splitlines()
+        lines = [
+            json.dumps({"custom_id": json.loads(request)["custom_id"], "response": {
+                "status_code": 200, "body": {"choices": [{"message": {"content": self.summary_text}}]}
+            }}) for request in requests
+        ]
+        return SimpleNamespace(text="\n".join(lines))
+
+
+def create_mock_client():
+    msg = MagicMock()
+    msg.date = END_DATE - timedelta(hours=1)
+    msg.text = "Hello"
+    msg.sender.first_name = "Alice"
+    msg.sender.last_name = "Smith"
+
+    mock_client = AsyncMock(TelegramClient)
+    mock_client.get_messages.side_effect = [[msg], []]
+    return mock_client
+
+
+# telegram_processor imports batch_processor from lambda_src/ directly, so patch that module
+@pytest.mark.asyncio
+@patch("lambda_src.telegram_processor.summarize_messages")
+async def test_process_channel_batch_mode_submits_and_later_posts(mock_summarize, tmp_path):
+    """ Test that a batch channel is submitted instead of summarized, and posted by a later collection."""
+    fake_api = FakeBatchAPI()
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    mock_client = create_mock_client()
+
+    with patch("batch_processor.AsyncOpenAI", fake_api):
+        await process_channel(mock_client, MOCK_CONFIG, MOCK_SECRETS, 100, "gpt-4o-mini", 0.0, "UTC", "dall-e-3",
+                              -10054321, END_DATE, checkpoint)
+
+        mock_summarize.assert_not_called()
+        mock_client.send_message.assert_not_awaited()
+        request = json.loads(fake_api.uploaded["file-0"])
+        assert request["custom_id"] == KEY
+        assert request["url"] == "/v1/chat/completions"
+        assert request["body"]["messages"][-1]["content"].endswith("Alice Smith: Hello")
+        assert checkpoint.get(KEY)["batch_submitted"] == "batch-0"
+
+        await collect_summary_batches(mock_client, [MOCK_CONFIG], checkpoint, MOCK_SECRETS, "dall-e-3", -10054321)
+
+    mock_client.send_message.assert_awaited_once()
+    posted_channel, posted_text = mock_client.send_message.await_args.args
+    assert posted_channel == -100987654321
+    assert "**Number of messages:** 1" in posted_text
+    assert posted_text.endswith("Batch summary")
+    assert checkpoint.get(KEY)["posted"] is True
+    assert checkpoint.get(pending_batches_key(-100123456789)) == {}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", ["in_progress", "cancelling"])
+async def test_collect_summary_batches_leaves_unfinished_batch(status, tmp_path):
+    """ Test that a batch still in progress or being cancelled is neither posted nor forgotten."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    checkpoint.mark(pending_batches_key(-100123456789), "batch-0", json.dumps({"keys": [KEY], "headers": {KEY: ""}}))
+    mock_client = AsyncMock(TelegramClient)
+
+    with patch("batch_processor.AsyncOpenAI", FakeBatchAPI(status=status)):
+        await collect_summary_batches(mock_client, [MOCK_CONFIG], checkpoint, MOCK_SECRETS, "dall-e-3", -10054321)
+
+    mock_client.send_message.assert_not_awaited()
+    assert "batch-0" in checkpoint.get(pending_batches_key(-100123456789))
+
+
+@pytest.mark.asyncio
+async def test_collect_summary_batches_reports_expired_batch(tmp_path):
+    """ Test that an expired batch is reported to the system channel and dropped."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    checkpoint.mark(pending_batches_key(-100123456789), "batch-0", json.dumps({"keys": [KEY], "headers": {KEY: ""}}))
+    mock_client = AsyncMock(TelegramClient)
+
+    with patch("batch_processor.AsyncOpenAI", FakeBatchAPI(status="expired")):
+        await collect_summary_batches(mock_client, [MOCK_CONFIG], checkpoint, MOCK_SECRETS, "dall-e-3", -10054321)
+
+    mock_client.send_message.assert_awaited_once_with(
+        -10054321, "Summary batch batch-0 for channel Test Channel ended as expired"
+    )
+    assert checkpoint.get(pending_batches_key(-100123456789)) == {}
+
+
+@pytest.mark.asyncio
+async def test_collect_summary_batches_posts_partial_output_of_expired_batch(tmp_path):
+    """ Test that results an expired batch finished in time are posted before the batch is reported."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    mock_client = create_mock_client()
+
+    with patch("batch_processor.AsyncOpenAI", FakeBatchAPI(status="expired", has_output=True)):
+        await process_channel(mock_client, MOCK_CONFIG, MOCK_SECRETS, 100, "gpt-4o-mini", 0.0, "UTC", "dall-e-3",
+                              -10054321, END_DATE, checkpoint)
+        await collect_summary_batches(mock_client, [MOCK_CONFIG], checkpoint, MOCK_SECRETS, "dall-e-3", -10054321)
+
+    assert [c.args[0] for c in mock_client.send_message.await_args_list] == [-100987654321, -10054321]
+    assert mock_client.send_message.await_args_list[0].args[1].endswith("Batch summary")
+    assert mock_client.send_message.await_args_list[1].args[1] == \
+        "Summary batch batch-0 for channel Test Channel ended as expired"
+    assert checkpoint.get(KEY)["posted"] is True
+    assert checkpoint.get(pending_batches_key(-100123456789)) == {}
+
+
+@pytest.mark.asyncio
+async def test_collect_summary_batches_reports_invalid_structured_result(tmp_path):
+    """ Test that a structured result that isn't valid JSON is reported and its batch dropped."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    mock_client = create_mock_client()
+    config = {**MOCK_CONFIG, "SUMMARY_FORMAT": "structured"}
+
+    with patch("batch_processor.AsyncOpenAI", FakeBatchAPI(summary_text="{not json")):
+        await process_channel(mock_client, config, MOCK_SECRETS, 100, "gpt-4o-mini", 0.0, "UTC", "dall-e-3",
+                              -10054321, END_DATE, checkpoint)
+        await collect_summary_batches(mock_client, [config], checkpoint, MOCK_SECRETS, "dall-e-3", -10054321)
+
+    mock_client.send_message.assert_awaited_once()
+    system_channel, error_message = mock_client.send_message.await_args.args
+    assert system_channel == -10054321
+    assert error_message.startswith(f"Summary batch batch-0 for channel Test Channel has an invalid result for {KEY}")
+    assert "posted" not in checkpoint.get(KEY)
+    assert checkpoint.get(pending_batches_key(-100123456789)) == {}
+
+
+@pytest.mark.asyncio
+async def test_collect_summary_batches_unknown_batch_does_not_block_others(tmp_path):
+    """ Test that a batch OpenAI doesn't know is reported and dropped, and later batches are still posted."""
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    checkpoint.mark(pending_batches_key(-100123456789), "batch-gone", json.dumps({"keys": [], "headers": {}}))
+    mock_client = create_mock_client()
+
+    with patch("batch_processor.AsyncOpenAI", FakeBatchAPI()):
+        await process_channel(mock_client, MOCK_CONFIG, MOCK_SECRETS, 100, "gpt-4o-mini", 0.0, "UTC", "dall-e-3",
+                              -10054321, END_DATE, checkpoint)
+        await collect_summary_batches(mock_client, [MOCK_CONFIG], checkpoint, MOCK_SECRETS, "dall-e-3", -10054321)
+
+    system_channel, error_message = mock_client.send_message.await_args_list[0].args
+    assert system_channel == -10054321
+    assert error_message.startswith("Summary batch batch-gone for channel Test Channel was not found")
+    assert mock_client.send_message.await_args_list[1].args[1].endswith("Batch summary")
+    assert checkpoint.get(KEY)["posted"] is True
+    assert checkpoint.get(pending_batches_key(-100123456789)) == {}
+
+
+def test_parse_batch_output_skips_failed_requests():
+    """ Test that only successful lines of the output file are returned."""
+    batch_output = "\n".join([
+        json.dumps({"custom_id": "a", "response": {"status_code": 200,
+                                                   "body": {"choices": [{"message": {"content": "ok"}}]}}}),
+        json.dumps({"custom_id": "b", "response": {"status_code": 500, "body": {}}}),
+        "",
+    ])
+
+    assert parse_batch_output(batch_output) == {"a": "ok"}
+
+
+def test_build_batch_request_structured():
+    """ Test that structured summaries request the JSON schema in the batch body as well."""
+    prompt_messages = build_prompt_messages("Alice: hi", "period", structured=True)
+
+    request = build_batch_request("key", prompt_messages, "gpt-4o-mini", 0.0, SUMMARY_RESPONSE_FORMAT)
+
+    assert request["body"]["response_format"] == SUMMARY_RESPONSE_FORMAT
+    assert [m["role"] for m in request["body"]["messages"]] == ["system", "user", "user", "user"]
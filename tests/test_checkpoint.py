@@ -0,0 +1,68 @@
+import boto3
+import pytest
+from datetime import datetime, timezone
+from moto import mock_aws
+from lambda_src.checkpoint import (
+    LocalFileCheckpointStore, DynamoDBCheckpointStore, S3CheckpointStore, checkpoint_key, create_checkpoint_store
+)
+
+KEY = checkpoint_key(-100123, datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 1, 2, tzinfo=timezone.utc))
+
+
+def test_checkpoint_key():
+    """ Test that the key identifies both the channel and the window."""
+    assert KEY == "-100123:2025-01-01T00:00:00+00:00:2025-01-02T00:00:00+00:00"
+
+
+def test_local_file_checkpoint_store(tmp_path):
+    """ Test that stages are persisted to the file and visible to a new store instance."""
+    path = str(tmp_path / "checkpoint.json")
+    store = LocalFileCheckpointStore(path)
+    assert store.get(KEY) == {}
+
+    store.mark(KEY, "fetched", 42)
+    store.mark(KEY, "summarized", "Резюме")
+
+    assert LocalFileCheckpointStore(path).get(KEY) == {"fetched": 42, "summarized": "Резюме"}
+
+
+@mock_aws
+def test_dynamodb_checkpoint_store():
+    """ Test that stages are stored as item attributes and returned without bookkeeping fields."""
+    boto3.client("dynamodb", region_name="us-west-2").create_table(
+        TableName="checkpoints",
+        KeySchema=[{"AttributeName": "checkpoint_key", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "checkpoint_key", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    store = DynamoDBCheckpointStore("checkpoints")
+    assert store.get(KEY) == {}
+
+    store.mark(KEY, "fetched", 42)
+    store.mark(KEY, "posted")
+
+    assert store.get(KEY) == {"fetched": 42, "posted": True}
+
+
+@mock_aws
+def test_s3_checkpoint_store():
+    """ Test that stages are stored as one JSON object per key."""
+    boto3.client("s3", region_name="us-west-2").create_bucket(
+        Bucket="checkpoints", CreateBucketConfiguration={"LocationConstraint": "us-west-2"}
+    )
+    store = S3CheckpointStore("checkpoints")
+    assert store.get(KEY) == {}
+
+    store.mark(KEY, "summarized", "Summary")
+    store.mark(KEY, "posted")
+
+    assert store.get(KEY) == {"summarized": "Summary", "posted": True}
+
+
+def test_create_checkpoint_store(tmp_path):
+    """ Test backend selection from config."""
+    assert create_checkpoint_store({"CHECKPOINT_BACKEND": "none"}) is None
+    assert isinstance(create_checkpoint_store({"CHECKPOINT_PATH": str(tmp_path / "c.json")}),
+                      LocalFileCheckpointStore)
+    with pytest.raises(ValueError, match="Unknown CHECKPOINT_BACKEND"):
+        create_checkpoint_store({"CHECKPOINT_BACKEND": "redis"})
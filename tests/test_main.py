@@ -1,15 +1,22 @@
 import pytest
+from datetime import timedelta
+from lambda_src.checkpoint import LocalFileCheckpointStore
 from lambda_src.main import async_main, lambda_handler
-from unittest.mock import patch, AsyncMock
+from lambda_src.utils import get_run_time
+from telethon import TelegramClient
+from unittest.mock import patch, AsyncMock, MagicMock
 
 
 @pytest.mark.asyncio
 @patch("lambda_src.main.get_secrets",
        return_value={"TELEGRAM_API_ID": "123", "TELEGRAM_API_HASH": "hash", "TELEGRAM_SESSION": "session"})
 @patch("lambda_src.main.load_config")
+@patch("lambda_src.main.create_checkpoint_store")
+@patch("lambda_src.main.collect_summary_batches", new_callable=AsyncMock)
 @patch("lambda_src.main.initialize_telegram_client", new_callable=AsyncMock)
 @patch("lambda_src.main.process_channel", new_callable=AsyncMock)
-async def test_async_main_success(mock_process_channel, mock_init_client, mock_load_config, _mock_get_secrets):
+async def test_async_main_success(mock_process_channel, mock_init_client, _mock_collect, _mock_create_checkpoint_store,
+                                  mock_load_config, _mock_get_secrets):
     """ Test `async_main` when all dependencies work correctly."""
     mock_load_config.return_value = {
         "SYSTEM_CHANNEL_ID": -100123456789,
@@ -58,10 +65,12 @@ async def test_async_main_config_failure(_mock_load_config, _mock_get_secrets):
        return_value={"TELEGRAM_API_ID": "123", "TELEGRAM_API_HASH": "hash", "TELEGRAM_SESSION": "session"})
 @patch("lambda_src.main.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": [
     {"SOURCE_CHANNEL_NAME": "Test Channel", "ENABLED": 1}]})
+@patch("lambda_src.main.create_checkpoint_store")
+@patch("lambda_src.main.collect_summary_batches", new_callable=AsyncMock)
 @patch("lambda_src.main.initialize_telegram_client", new_callable=AsyncMock)
 @patch("lambda_src.main.process_channel", side_effect=Exception("Process channel error"))
-async def test_async_main_process_channel_failure(_mock_process_channel, _mock_init_client, _mock_load_config,
-                                                  _mock_get_secrets):
+async def test_async_main_process_channel_failure(_mock_process_channel, _mock_init_client, _mock_collect,
+                                                  _mock_create_checkpoint_store, _mock_load_config, _mock_get_secrets):
     """ Test `async_main` when `process_channel` fails."""
     result = await async_main({}, {})
 
@@ -95,10 +104,13 @@ async def test_async_main_missing_system_channel_id(_mock_load_config, _mock_get
        return_value={"TELEGRAM_API_ID": "123", "TELEGRAM_API_HASH": "hash", "TELEGRAM_SESSION": "session"})
 @patch("lambda_src.main.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": [
     {"SOURCE_CHANNEL_NAME": "Test Channel", "ENABLED": 1}]})
+@patch("lambda_src.main.create_checkpoint_store")
+@patch("lambda_src.main.collect_summary_batches", new_callable=AsyncMock)
 @patch("lambda_src.main.initialize_telegram_client", new_callable=AsyncMock)
 @patch("lambda_src.main.process_channel", new_callable=AsyncMock)
-async def test_async_main_process_channel_unexpected_response(_mock_process_channel, _mock_init_client,
-                                                              _mock_load_config, _mock_get_secrets):
+async def test_async_main_process_channel_unexpected_response(_mock_process_channel, _mock_init_client, _mock_collect,
+                                                              _mock_create_checkpoint_store, _mock_load_config,
+                                                              _mock_get_secrets):
     """ Test `async_main` when `process_channel()` returns an unexpected response."""
     _mock_process_channel.return_value = "Unexpected return value"
 
@@ -113,11 +125,13 @@ async def test_async_main_process_channel_unexpected_response(_mock_process_chan
        return_value={"TELEGRAM_API_ID": "123", "TELEGRAM_API_HASH": "hash", "TELEGRAM_SESSION": "session"})
 @patch("lambda_src.main.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": [
     {"SOURCE_CHANNEL_NAME": "Test Channel", "ENABLED": 1}]})
+@patch("lambda_src.main.create_checkpoint_store")
+@patch("lambda_src.main.collect_summary_batches", new_callable=AsyncMock)
 @patch("lambda_src.main.initialize_telegram_client", new_callable=AsyncMock)
 @patch("lambda_src.main.process_channel", side_effect=Exception("Process channel error"))
 @patch("lambda_src.main.logging.getLogger")
-async def test_async_main_sends_error_to_telegram(_mock_logger, _mock_process_channel, mock_init_client,
-                                                  _mock_load_config, _mock_get_secrets):
+async def test_async_main_sends_error_to_telegram(_mock_logger, _mock_process_channel, mock_init_client, _mock_collect,
+                                                  _mock_create_checkpoint_store, _mock_load_config, _mock_get_secrets):
     """ Test `async_main` attempts to send error message to Telegram system channel."""
     mock_client_instance = AsyncMock()
     mock_init_client.return_value = mock_client_instance
@@ -135,8 +149,11 @@ async def test_async_main_sends_error_to_telegram(_mock_logger, _mock_process_ch
 @patch("lambda_src.main.get_secrets", return_value={"TELEGRAM_API_ID": "123", "TELEGRAM_API_HASH": "hash",
                                                     "TELEGRAM_SESSION": "session"})
 @patch("lambda_src.main.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": []})
+@patch("lambda_src.main.create_checkpoint_store")
+@patch("lambda_src.main.collect_summary_batches", new_callable=AsyncMock)
 @patch("lambda_src.main.initialize_telegram_client", new_callable=AsyncMock)
-async def test_async_main_no_channels(_mock_init_client, _mock_load_config, _mock_get_secrets):
+async def test_async_main_no_channels(_mock_init_client, _mock_collect, _mock_create_checkpoint_store,
+                                      _mock_load_config, _mock_get_secrets):
     """ Test `async_main` when `channels` list is empty in config."""
     result = await async_main({}, {})
 
@@ -144,3 +161,56 @@ async def test_async_main_no_channels(_mock_init_client, _mock_load_config, _moc
     assert "Successfully processed all channels" in result["body"]
 
     _mock_init_client.assert_awaited_once()
+
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.main.get_secrets", return_value={"TELEGRAM_API_ID": "123", "TELEGRAM_API_HASH": "hash",
+                                                    "TELEGRAM_SESSION": "session"})
+@patch("lambda_src.main.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": [
+    {"SOURCE_CHANNEL_NAME": "Test Channel", "ENABLED": 1}]})
+@patch("lambda_src.main.create_checkpoint_store")
+@patch("lambda_src.main.collect_summary_batches", new_callable=AsyncMock)
+@patch("lambda_src.main.initialize_telegram_client", new_callable=AsyncMock)
+@patch("lambda_src.main.process_channel", new_callable=AsyncMock)
+async def test_async_main_collects_batches_before_channels(mock_process_channel, _mock_init_client, mock_collect,
+                                                           _mock_create_checkpoint_store, _mock_load_config,
+                                                           _mock_get_secrets):
+    """ Test that batches from earlier runs are collected before any channel task starts."""
+    calls = []
+    mock_collect.side_effect = lambda *_args: calls.append("collect")
+    mock_process_channel.side_effect = lambda *_args: calls.append("process_channel")
+
+    result = await async_main({}, {})
+
+    assert result["statusCode"] == 200
+    assert calls == ["collect", "process_channel"]
+
+
+# main imports telegram_processor from lambda_src/ directly, so patch that module
+@pytest.mark.asyncio
+@patch("lambda_src.main.get_secrets", return_value={"TELEGRAM_API_ID": "123", "TELEGRAM_API_HASH": "hash",
+                                                    "TELEGRAM_SESSION": "session", "OPENAI_API_KEY": "fake_key"})
+@patch("lambda_src.main.load_config", return_value={"SYSTEM_CHANNEL_ID": -100123456789, "channels": [
+    {"SOURCE_CHANNEL_NAME": "Test Channel", "SOURCE_CHANNEL_ID": -100111, "SUMMARY_CHANNEL_ID": -100222}]})
+@patch("lambda_src.main.initialize_telegram_client", new_callable=AsyncMock)
+@patch("lambda_src.main.create_checkpoint_store")
+@patch("lambda_src.main.collect_summary_batches", new_callable=AsyncMock)
+@patch("telegram_processor.summarize_messages", return_value="Daily summary")
+async def test_async_main_manual_rerun_posts_nothing(mock_summarize, _mock_collect, mock_create_checkpoint_store,
+                                                     mock_init_client, _mock_load_config, _mock_get_secrets,
+                                                     tmp_path):
+    """ Test that invoking `async_main` again without an event reuses the same window and posts nothing."""
+    mock_create_checkpoint_store.return_value = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    msg = MagicMock()
+    msg.date = get_run_time({}) - timedelta(hours=1)
+    mock_client = AsyncMock(TelegramClient)
+    mock_client.get_messages.side_effect = lambda channel, limit, offset_date, offset_id: [] if offset_id else [msg]
+    mock_init_client.return_value = mock_client
+
+    first_result = await async_main({}, {})
+    second_result = await async_main({}, {})
+
+    assert first_result["statusCode"] == second_result["statusCode"] == 200
+    mock_summarize.assert_called_once()
+    mock_client.send_message.assert_awaited_once_with(-100222, "Daily summary")
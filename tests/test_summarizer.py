@@ -1,9 +1,22 @@
 import pytest
 import datetime
 from unittest.mock import patch, AsyncMock
-from lambda_src.summarizer import summarize_messages, generate_image
+import json
+from lambda_src.summarizer import (
+    summarize_messages, summarize_messages_structured, generate_image, build_prompt_messages, format_conversation,
+    render_summary_markdown, prepare_summary_prompt, STATIC_PROMPT_PREFIX, SUMMARY_RESPONSE_FORMAT, FRIDAY_PROMPT
+)
 from unittest.mock import MagicMock
 
+STRUCTURED_SUMMARY = {"topics": [{
+    "title": "Project kickoff",
+    "summary": "Alice proposed to discuss the project.",
+    "participants": ["Alice Smith"],
+    "first_message_id": 101,
+    "last_message_id": 103,
+    "links": ["https://example.com/plan"],
+}]}
+
 
 @pytest.fixture
 def fake_messages():
@@ -58,6 +71,72 @@ def test_summarize_messages(mock_chat_openai, fake_messages):
     assert "**Number of messages:** 3" in summary
 
 
+def test_build_prompt_messages_static_prefix():
+    """ Test that variable parts are appended after an unchanged static prefix."""
+    regular = build_prompt_messages("Alice: hi", "2025-01-01 - 2025-01-02")
+    friday = build_prompt_messages("Bob: hello", "2025-01-03 - 2025-01-04", friday_mode=True)
+
+    assert regular[:2] == friday[:2] == list(STATIC_PROMPT_PREFIX)
+    assert len(regular) == 3
+    assert "Happy Friday" in friday[2].content
+    assert friday[3].content.endswith("Bob: hello")
+
+
+def test_prepare_summary_prompt_friday_mode_in_utc(fake_messages):
+    """ Test that the Friday edition depends on the UTC day the window ends, whatever offset it is given in."""
+    end_date = datetime.datetime.fromisoformat("2025-01-03T22:00:00-06:00")  # Saturday 04:00 UTC
+
+    prompt_messages, _ = prepare_summary_prompt(fake_messages, end_date - datetime.timedelta(days=1), end_date, "UTC")
+
+    assert any(m.content == FRIDAY_PROMPT for m in prompt_messages)
+
+
+def test_build_prompt_messages_keeps_braces(fake_messages):
+    """ Test that braces in chat text are passed through instead of being parsed as template variables."""
+    fake_messages[0].text = "config is {\"key\": {value}}"
+
+    prompt_messages = build_prompt_messages(format_conversation(fake_messages), "period")
+
+    assert "Alice Smith: config is {\"key\": {value}}" in prompt_messages[-1].content
+
+
+@patch("lambda_src.summarizer.ChatOpenAI")
+def test_summarize_messages_structured(mock_chat_openai, fake_messages):
+    """ Test that the structured summary comes from the same call and is rendered locally."""
+    for message_id, msg in enumerate(fake_messages, start=101):
+        msg.id = message_id
+    mock_chat_instance = mock_chat_openai.return_value
+    mock_chat_instance.invoke.return_value.content = json.dumps(STRUCTURED_SUMMARY)
+
+    summary, summary_data = summarize_messages_structured(
+        messages=fake_messages,
+        start_date=datetime.datetime.now(datetime.UTC),
+        end_date=datetime.datetime.now(datetime.UTC),
+        llm_model_name="gpt-4",
+        llm_temperature=0.7,
+        reader_timezone="UTC",
+        openai_api_key="fake_key"
+    )
+
+    prompt_messages = mock_chat_instance.invoke.call_args.args[0]
+    assert mock_chat_instance.invoke.call_args.kwargs["response_format"] == SUMMARY_RESPONSE_FORMAT
+    assert "[101] Alice Smith: Hello, how are you?" in prompt_messages[-1].content
+    assert summary_data == STRUCTURED_SUMMARY
+    assert "**Number of messages:** 3" in summary
+    assert "**Project kickoff**" in summary
+
+
+def test_render_summary_markdown():
+    """ Test rendering of a structured summary as Telegram markdown."""
+    assert render_summary_markdown(STRUCTURED_SUMMARY) == (
+        "**Project kickoff**\n"
+        "Alice proposed to discuss the project.\n"
+        "__Participants:__ Alice Smith\n"
+        "__Messages:__ 101–103\n"
+        "https://example.com/plan"
+    )
+
+
 @patch("lambda_src.summarizer.ChatOpenAI")
 def test_summarize_messages_api_failure(mock_chat_openai, fake_messages):
     """ Test API failure handling in summarization."""
@@ -126,3 +205,25 @@ async def test_generate_image_network_error(mock_post):
     )
 
     assert "**[Error occurred while generating image]**" in image_url
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.summarizer.aiohttp.ClientSession.post")
+async def test_generate_image_from_topics(mock_post):
+    """ Test that given topics are used directly instead of asking the model to extract them."""
+    mock_response = AsyncMock()
+    mock_response.status = 200
+    mock_response.json.return_value = {"data": [{"url": "https://fakeimage.com/image.png"}]}
+    mock_post.return_value.__aenter__.return_value = mock_response
+
+    await generate_image(
+        summary_text="Summary content",
+        image_model_name="dall-e-3",
+        openai_api_key="fake_key",
+        topics=["Cars", "Food"]
+    )
+
+    image_prompt = mock_post.call_args.kwargs["json"]["prompt"]
+    assert "Cars; Food" in image_prompt
+    assert "Extract" not in image_prompt
+    assert "Summary content" not in image_prompt
@@ -0,0 +1,33 @@
+import os
+from datetime import datetime, timezone
+from lambda_src.summary_index import append_to_summary_index, search_summary_index
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+END = datetime(2025, 1, 2, tzinfo=timezone.utc)
+
+
+def make_summary(*titles):
+    return {"topics": [
+        {"title": title, "summary": f"About {title}", "participants": ["Alice Smith"], "first_message_id": 1,
+         "last_message_id": 2, "links": []}
+        for title in titles
+    ]}
+
+
+def test_summary_index_search(tmp_path):
+    """ Test that topics are indexed per channel and found by title, summary or participant."""
+    index_path = str(tmp_path / "index.jsonl")
+    append_to_summary_index(index_path, -100123, "Channel A", START, END, make_summary("Cars", "Taxes"))
+    append_to_summary_index(index_path, -100456, "Channel B", START, END, make_summary("Used cars"))
+
+    assert [e["title"] for e in search_summary_index(index_path, "CARS")] == ["Cars", "Used cars"]
+    assert [e["title"] for e in search_summary_index(index_path, "cars", -100456)] == ["Used cars"]
+    assert len(search_summary_index(index_path, "alice")) == 3
+    assert search_summary_index(index_path, "cars")[0]["start_date"] == START.isoformat()
+
+
+def test_summary_index_missing_file(tmp_path):
+    """ Test searching before anything was indexed."""
+    index_path = str(tmp_path / "index.jsonl")
+    assert not os.path.exists(index_path)
+    assert search_summary_index(index_path, "cars") == []
@@ -1,8 +1,18 @@
 import pytest
-from unittest.mock import AsyncMock
-from lambda_src.telegram_processor import process_channel
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, AsyncMock, MagicMock
+from lambda_src.checkpoint import LocalFileCheckpointStore, checkpoint_key
+from lambda_src.summary_index import search_summary_index
+from lambda_src.telegram_processor import fetch_messages, process_channel, store_summary
 from telethon import TelegramClient
 
+MOCK_CONFIG = {
+    "SOURCE_CHANNEL_ID": -100123456789,
+    "SUMMARY_CHANNEL_ID": -100987654321,
+    "GENERATE_IMAGE": 0,
+    "SUMMARY_PERIOD_HOURS": 24
+}
+
 
 @pytest.mark.asyncio
 async def test_process_channel_no_messages(monkeypatch):
@@ -26,3 +36,100 @@ async def test_process_channel_no_messages(monkeypatch):
                           -10054321)
 
     mock_client.send_message.assert_called_with(-10054321, "No new messages found for channel Unknown")
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.telegram_processor.summarize_messages")
+async def test_process_channel_skips_finished_window(mock_summarize, tmp_path):
+    """ Test that a retried run doesn't refetch, resummarize or repost an already posted window."""
+    end_date = datetime(2025, 1, 2, 4, tzinfo=timezone.utc)
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    checkpoint.mark(checkpoint_key(-100123456789, end_date - timedelta(hours=24), end_date), "posted")
+    mock_client = AsyncMock(TelegramClient)
+
+    await process_channel(mock_client, MOCK_CONFIG, {"OPENAI_API_KEY": "fake_openai_key"}, 100, "gpt-4", 0.7,
+                          "US/Central", "dall-e-3", -10054321, end_date, checkpoint)
+
+    mock_client.get_entity.assert_not_awaited()
+    mock_summarize.assert_not_called()
+    mock_client.send_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.telegram_processor.summarize_messages")
+async def test_process_channel_reuses_checkpointed_summary(mock_summarize, tmp_path):
+    """ Test that a run which failed after summarizing posts the stored summary without calling the LLM."""
+    end_date = datetime(2025, 1, 2, 4, tzinfo=timezone.utc)
+    key = checkpoint_key(-100123456789, end_date - timedelta(hours=24), end_date)
+    checkpoint = LocalFileCheckpointStore(str(tmp_path / "checkpoint.json"))
+    checkpoint.mark(key, "summarized", "Stored summary")
+    mock_client = AsyncMock(TelegramClient)
+
+    await process_channel(mock_client, MOCK_CONFIG, {"OPENAI_API_KEY": "fake_openai_key"}, 100, "gpt-4", 0.7,
+                          "US/Central", "dall-e-3", -10054321, end_date, checkpoint)
+
+    mock_summarize.assert_not_called()
+    mock_client.send_message.assert_awaited_once_with(-100987654321, "Stored summary")
+    assert checkpoint.get(key)["posted"] is True
+
+
+@pytest.mark.asyncio
+@patch("lambda_src.telegram_processor.send_summary_image", new_callable=AsyncMock)
+@patch("lambda_src.telegram_processor.summarize_messages_structured")
+async def test_process_channel_structured_summary(mock_summarize, mock_send_image, tmp_path):
+    """ Test that a structured summary is indexed and its topics are reused for the illustration."""
+    msg = MagicMock()
+    msg.date = datetime.now(timezone.utc) - timedelta(hours=1)
+    mock_client = AsyncMock(TelegramClient)
+    mock_client.get_messages.side_effect = [[msg], []]
+    summary_data = {"topics": [{"title": "Cars", "summary": "About cars", "participants": ["Alice"],
+                                "first_message_id": 1, "last_message_id": 1, "links": []}]}
+    mock_summarize.return_value = ("**Cars**", summary_data)
+    index_path = str(tmp_path / "index.jsonl")
+    config = {**MOCK_CONFIG, "GENERATE_IMAGE": 1, "SUMMARY_FORMAT": "structured"}
+
+    await process_channel(mock_client, config, {"OPENAI_API_KEY": "fake_openai_key"}, 100, "gpt-4", 0.7,
+                          "US/Central", "dall-e-3", -10054321, summary_index_path=index_path)
+
+    mock_client.send_message.assert_awaited_once_with(-100987654321, "**Cars**")
+    assert mock_send_image.await_args.args[-1] == ["Cars"]
+    assert [e["title"] for e in search_summary_index(index_path, "cars")] == ["Cars"]
+
+
+def test_store_summary_checkpoints_before_indexing(tmp_path):
+    """ Test that a summary whose checkpoint failed is not indexed, so the retry doesn't index it twice."""
+    checkpoint = MagicMock()
+    checkpoint.mark.side_effect = OSError("Disk full")
+    summary_data = {"topics": [{"title": "Cars", "summary": "About cars", "participants": ["Alice"],
+                                "first_message_id": 1, "last_message_id": 1, "links": []}]}
+    index_path = str(tmp_path / "index.jsonl")
+    end_date = datetime(2025, 1, 2, 4, tzinfo=timezone.utc)
+
+    with pytest.raises(OSError):
+        store_summary(checkpoint, "key", "**Cars**", summary_data, MOCK_CONFIG, end_date - timedelta(hours=24),
+                      end_date, index_path)
+
+    assert search_summary_index(index_path, "cars") == []
+
+
+@pytest.mark.asyncio
+async def test_fetch_messages_pages_by_message_id():
+    """ Test that messages sharing a timestamp across a page boundary, like albums, are all fetched."""
+    end_date = datetime(2025, 1, 2, 4, tzinfo=timezone.utc)
+    history = []  # Newest first, as returned by Telegram
+    for msg_id in range(150, 0, -1):
+        msg = MagicMock()
+        msg.id = msg_id
+        msg.date = end_date - timedelta(minutes=1 if msg_id > 90 else 2)  # Page boundary inside the same second
+        history.append(msg)
+
+    async def get_messages(channel, limit, offset_date, offset_id=0):
+        older = [m for m in history if m.date < offset_date and (not offset_id or m.id < offset_id)]
+        return older[:limit]
+
+    mock_client = AsyncMock(TelegramClient)
+    mock_client.get_messages.side_effect = get_messages
+
+    messages = await fetch_messages(mock_client, "channel", end_date - timedelta(hours=1), end_date, None)
+
+    assert [m.id for m in messages] == list(range(1, 151))
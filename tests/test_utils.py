@@ -1,9 +1,10 @@
 import pytest
 import os
+from datetime import datetime, timezone
 from unittest.mock import patch, AsyncMock
 from moto import mock_aws
 import boto3
-from lambda_src.utils import get_secrets, load_config, initialize_telegram_client
+from lambda_src.utils import get_secrets, load_config, initialize_telegram_client, get_run_time, floor_to_run_hour
 from telethon.sessions import StringSession
 
 # Define test config file path
@@ -83,3 +84,23 @@ async def test_initialize_telegram_client(mock_telegram_client):
     assert client == mock_client_instance, "Telegram client instance mismatch"
     mock_client_instance.connect.assert_awaited_once(), "Client should attempt to connect"
     mock_client_instance.is_user_authorized.assert_awaited_once(), "Authorization check should happen"
+
+
+def test_get_run_time_from_event():
+    """ Test that the EventBridge scheduled time is used, so retries of the same event share their windows."""
+    assert get_run_time({"time": "2025-01-02T04:00:00Z"}) == datetime(2025, 1, 2, 4, tzinfo=timezone.utc)
+    assert get_run_time({}).tzinfo == timezone.utc
+
+
+def test_get_run_time_floors_to_schedule_slot():
+    """ Test that runs outside the schedule, like manual re-runs, get the last scheduled time."""
+    assert get_run_time({"time": "2025-01-02T15:30:12Z"}) == datetime(2025, 1, 2, 4, tzinfo=timezone.utc)
+    assert get_run_time({"time": "2025-01-02T03:59:00Z"}) == datetime(2025, 1, 1, 4, tzinfo=timezone.utc)
+    assert get_run_time({"time": "2025-01-02T03:59:00Z"}, 2) == datetime(2025, 1, 2, 2, tzinfo=timezone.utc)
+    assert get_run_time({}).minute == 0
+
+
+def test_floor_to_run_hour_converts_to_utc():
+    """ Test that times with an offset are floored in UTC."""
+    assert floor_to_run_hour(datetime.fromisoformat("2025-01-01T23:30:00-06:00")) == \
+        datetime(2025, 1, 2, 4, tzinfo=timezone.utc)